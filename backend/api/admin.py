@@ -2,9 +2,90 @@
 Star Auto - Django Admin Configuration
 """
 
+import hashlib
+from decimal import Decimal
+
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.helpers import ActionForm
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Car, Message
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import F, Max
+from django.db.models.functions import Round
+from django.http import HttpResponseRedirect
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .history import tracked_values
+from .models import (
+    User, Car, CarHistory, Message, PriceStatistic, SavedSearch, SearchAlert, ArchivedCar, ArchivedMessage,
+    AuditEntry, StoredImage
+)
+from .signals import cars_bulk_updated
+
+
+ADMIN_CACHE_TIMEOUT = 300  # seconds
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator whose COUNT(*) is cached for a few minutes per query. On
+    PostgreSQL an unfiltered changelist uses the planner's row estimate
+    instead of counting large tables.
+    """
+    estimate_threshold = 10000
+    
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        try:
+            sql, params = query.sql_with_params()
+        except Exception:
+            return super().count
+        key = 'admin:count:' + hashlib.md5(f'{sql}{params}'.encode('utf-8')).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = self._estimated_count()
+            if count is None:
+                count = super().count
+            cache.set(key, count, ADMIN_CACHE_TIMEOUT)
+        return count
+    
+    def _estimated_count(self):
+        query = self.object_list.query
+        if connection.vendor != 'postgresql' or query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [self.object_list.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= self.estimate_threshold:
+            return row[0]
+        return None
+
+
+class CachedAllValuesFieldListFilter(admin.AllValuesFieldListFilter):
+    """Distinct-values filter whose choice list is cached instead of scanning the table."""
+    
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        key = f'admin:choices:{model._meta.label_lower}:{field_path}'
+        choices = cache.get(key)
+        if choices is None:
+            choices = list(self.lookup_choices)
+            cache.set(key, choices, ADMIN_CACHE_TIMEOUT)
+        self.lookup_choices = choices
+
+
+class CarActionForm(ActionForm):
+    percentage = forms.DecimalField(
+        label='Ajustement (%)', required=False, max_digits=5, decimal_places=2,
+        min_value=Decimal('-90'), max_value=Decimal('100')
+    )
 
 
 @admin.register(User)
@@ -13,8 +94,10 @@ class UserAdmin(BaseUserAdmin):
     
     list_display = ['username', 'email', 'nom', 'role', 'is_active', 'date_joined']
     list_filter = ['role', 'is_active', 'is_staff']
-    search_fields = ['username', 'email', 'nom']
+    search_fields = ['^username', '=email', '^nom']
     ordering = ['-date_joined']
+    paginator = CachedCountPaginator
+    show_full_result_count = False
     
     fieldsets = BaseUserAdmin.fieldsets + (
         ('Informations supplémentaires', {'fields': ('nom', 'telephone', 'address', 'role')}),
@@ -25,16 +108,37 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+class CarHistoryInline(admin.TabularInline):
+    """Read-only price and availability history of a car."""
+    
+    model = CarHistory
+    fields = ['changed_at', 'ancien_prix', 'prix', 'disponibilite']
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    ordering = ['-changed_at']
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Car)
 class CarAdmin(admin.ModelAdmin):
     """Admin configuration for Car model."""
     
     list_display = ['marque', 'modele', 'annee', 'prix', 'carburant', 'transmission', 'disponibilite', 'created_at']
-    list_filter = ['marque', 'carburant', 'transmission', 'disponibilite', 'annee']
-    search_fields = ['marque', 'modele', 'description']
+    list_filter = [
+        ('marque', CachedAllValuesFieldListFilter), 'carburant', 'transmission', 'disponibilite',
+        ('annee', CachedAllValuesFieldListFilter), 'created_at',
+    ]
+    search_fields = ['^marque', '^modele']
     list_editable = ['disponibilite', 'prix']
     ordering = ['-created_at']
-    date_hierarchy = 'created_at'
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+    action_form = CarActionForm
+    actions = ['mark_unavailable', 'adjust_price']
+    inlines = [CarHistoryInline]
     
     fieldsets = (
         ('Informations générales', {
@@ -49,7 +153,51 @@ class CarAdmin(admin.ModelAdmin):
         ('Images', {
             'fields': ('images',)
         }),
+        ('Popularité', {
+            'fields': ('vues', 'nb_favoris', 'popularite')
+        }),
     )
+    readonly_fields = ['vues', 'nb_favoris', 'popularite']
+    
+    def _bulk_update(self, queryset, **values):
+        """Apply ``values`` in one UPDATE and notify bulk-update listeners."""
+        with transaction.atomic():
+            previous = tracked_values(queryset)
+            updated = queryset.update(updated_at=timezone.now(), **values)
+            cars_bulk_updated.send(sender=Car, pks=list(previous), fields=list(values), previous=previous)
+        return updated
+    
+    @admin.action(description='Marquer comme indisponible')
+    def mark_unavailable(self, request, queryset):
+        updated = self._bulk_update(queryset, disponibilite=False)
+        self.message_user(request, f'{updated} voiture(s) marquée(s) comme indisponible(s).')
+    
+    def response_action(self, request, queryset):
+        # An invalid action form is otherwise reported as "no action selected".
+        if request.POST.get('action') == 'adjust_price':
+            form = self.action_form(request.POST)
+            form.full_clean()
+            if 'percentage' in form.errors:
+                self.message_user(request, ' '.join(form.errors['percentage']), level='error')
+                return HttpResponseRedirect(request.get_full_path())
+        return super().response_action(request, queryset)
+    
+    @admin.action(description='Ajuster le prix du pourcentage indiqué')
+    def adjust_price(self, request, queryset):
+        form = self.action_form(request.POST)
+        form.full_clean()
+        percentage = form.cleaned_data.get('percentage')
+        if percentage is None:
+            self.message_user(request, 'Indiquez un pourcentage.', level='error')
+            return
+        factor = 1 + percentage / 100
+        field = Car._meta.get_field('prix')
+        highest = queryset.aggregate(highest=Max('prix'))['highest']
+        if highest is not None and round(highest * factor, field.decimal_places) >= 10 ** (field.max_digits - field.decimal_places):
+            self.message_user(request, 'Ce pourcentage dépasserait le prix maximal.', level='error')
+            return
+        updated = self._bulk_update(queryset, prix=Round(F('prix') * factor, 2))
+        self.message_user(request, f'Prix ajusté de {percentage}% pour {updated} voiture(s).')
 
 
 @admin.register(Message)
@@ -57,12 +205,15 @@ class MessageAdmin(admin.ModelAdmin):
     """Admin configuration for Message model."""
     
     list_display = ['nom', 'email', 'sujet', 'voiture', 'lu', 'created_at']
+    list_select_related = ['voiture']
     list_filter = ['lu', 'created_at']
-    search_fields = ['nom', 'email', 'message', 'sujet']
+    search_fields = ['=email', '^nom', '^sujet']
     list_editable = ['lu']
     ordering = ['-created_at']
-    date_hierarchy = 'created_at'
     readonly_fields = ['created_at']
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+    actions = ['mark_read', 'mark_unread']
     
     fieldsets = (
         ('Expéditeur', {
@@ -75,3 +226,132 @@ class MessageAdmin(admin.ModelAdmin):
             'fields': ('lu', 'created_at')
         }),
     )
+    
+    @admin.action(description='Marquer comme lu')
+    def mark_read(self, request, queryset):
+        updated = queryset.update(lu=True)
+        self.message_user(request, f'{updated} message(s) marqué(s) comme lu(s).')
+    
+    @admin.action(description='Marquer comme non lu')
+    def mark_unread(self, request, queryset):
+        updated = queryset.update(lu=False)
+        self.message_user(request, f'{updated} message(s) marqué(s) comme non lu(s).')
+
+
+@admin.register(PriceStatistic)
+class PriceStatisticAdmin(admin.ModelAdmin):
+    """Read-only admin for materialized price statistics."""
+    
+    list_display = ['marque', 'modele', 'annee', 'level', 'count', 'median', 'p10', 'p90', 'km_slope', 'refreshed_at']
+    list_filter = ['level']
+    search_fields = ['marque', 'modele']
+    ordering = ['marque', 'modele', 'annee']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SavedSearch)
+class SavedSearchAdmin(admin.ModelAdmin):
+    """Admin configuration for SavedSearch model."""
+    
+    list_display = ['__str__', 'user', 'marque', 'annee', 'prix_min', 'prix_max', 'carburant', 'active', 'created_at']
+    list_select_related = ['user']
+    list_filter = ['active', 'carburant']
+    search_fields = ['=user__email', '^marque']
+    raw_id_fields = ['user']
+    readonly_fields = ['created_at', 'updated_at']
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(SearchAlert)
+class SearchAlertAdmin(admin.ModelAdmin):
+    """Admin configuration for SearchAlert model."""
+    
+    list_display = ['car', 'user', 'search', 'lu', 'notified_at', 'created_at']
+    list_select_related = ['car', 'user', 'search']
+    list_filter = ['lu']
+    search_fields = ['=user__email']
+    raw_id_fields = ['search', 'user', 'car']
+    readonly_fields = ['created_at']
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+
+
+class ReadOnlyArchiveAdmin(admin.ModelAdmin):
+    """Archived rows are browsed, never edited."""
+    
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedCar)
+class ArchivedCarAdmin(ReadOnlyArchiveAdmin):
+    """Admin configuration for ArchivedCar model."""
+    
+    list_display = ['marque', 'modele', 'annee', 'prix', 'updated_at', 'archived_at']
+    search_fields = ['^marque', '^modele']
+    ordering = ['-archived_at']
+
+
+@admin.register(ArchivedMessage)
+class ArchivedMessageAdmin(ReadOnlyArchiveAdmin):
+    """Admin configuration for ArchivedMessage model."""
+    
+    list_display = ['nom', 'email', 'sujet', 'voiture_id', 'created_at', 'archived_at']
+    search_fields = ['=email', '^nom']
+    ordering = ['-created_at']
+
+
+
+@admin.register(AuditEntry)
+class AuditEntryAdmin(admin.ModelAdmin):
+    """The audit log is append-only: browsed, never edited or deleted."""
+    
+    list_display = ['created_at', 'actor', 'action', 'model', 'object_id']
+    list_select_related = ['actor']
+    list_filter = ['action', 'model']
+    search_fields = ['=object_id']
+    ordering = ['-created_at']
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StoredImage)
+class StoredImageAdmin(admin.ModelAdmin):
+    """Stored images are managed by the upload API and cleanupuploads."""
+    
+    list_display = ['sha256', 'extension', 'size', 'ref_count', 'orphaned_at', 'created_at']
+    list_filter = ['extension']
+    search_fields = ['=sha256']
+    ordering = ['-created_at']
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,206 @@
+"""
+Star Auto - Price Analytics
+
+Computes price statistics over the whole Car table with NumPy (grouped
+percentiles, depreciation against kilometrage, robust outlier scores) and
+materializes them into PriceStatistic rows. Refreshes are incremental:
+only brands with cars changed, added or removed since the last refresh
+are recomputed.
+"""
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import Car, PriceStatistic
+
+
+QUANTILES = (0.10, 0.25, 0.50, 0.75, 0.90)
+KM_BUCKETS = [0, 10000, 30000, 60000, 100000, 150000]
+OUTLIER_THRESHOLD = 3.5
+OUTLIER_MIN_COUNT = 5
+FIELDS = ('id', 'marque', 'modele', 'annee', 'prix', 'kilometrage')
+
+
+def _grouped_quantiles(codes, values, n_groups, quantiles):
+    """Linear-interpolated quantiles of ``values`` within each group code."""
+    order = np.lexsort((values, codes))
+    sorted_values = values[order]
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    result = []
+    for q in quantiles:
+        pos = starts + q * np.maximum(counts - 1, 0)
+        low = np.floor(pos).astype(np.int64)
+        high = np.ceil(pos).astype(np.int64)
+        frac = pos - low
+        result.append(sorted_values[low] * (1 - frac) + sorted_values[high] * frac)
+    return counts, result
+
+
+def _km_slopes(codes, km, prix, n_groups):
+    """
+    Fit log(prix) = a + b * km per group; return the relative price change
+    per 10,000 km (None where the fit is undefined).
+    """
+    counts = np.bincount(codes, minlength=n_groups)
+    log_prix = np.log(np.maximum(prix, 1.0))
+    sum_x = np.bincount(codes, km, n_groups)
+    sum_y = np.bincount(codes, log_prix, n_groups)
+    sum_xx = np.bincount(codes, km * km, n_groups)
+    sum_xy = np.bincount(codes, km * log_prix, n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = sum_xx - sum_x * sum_x / counts
+        slope = (sum_xy - sum_x * sum_y / counts) / variance
+    valid = (counts >= 3) & (variance > 0)
+    change = np.expm1(np.where(valid, slope, 0) * 10000)
+    return [float(value) if ok else None for value, ok in zip(change, valid)]
+
+
+def _km_curves(codes, km, prix, n_groups):
+    """Median price per kilometrage bucket for each group."""
+    buckets = np.digitize(km, KM_BUCKETS[1:])
+    n_buckets = len(KM_BUCKETS)
+    combined = codes * n_buckets + buckets
+    present, inverse = np.unique(combined, return_inverse=True)
+    counts, (medians,) = _grouped_quantiles(inverse, prix, len(present), (0.5,))
+    curves = [[] for _ in range(n_groups)]
+    for key, count, median in zip(present, counts, medians):
+        group, bucket = divmod(int(key), n_buckets)
+        curves[group].append({
+            'km_min': KM_BUCKETS[bucket],
+            'km_max': KM_BUCKETS[bucket + 1] if bucket + 1 < n_buckets else None,
+            'count': int(count),
+            'median': round(float(median), 2),
+        })
+    return curves
+
+
+def _outliers(codes, ids, prix, medians, n_groups):
+    """Flag prices far from their group median using the MAD-based robust z-score."""
+    deviation = np.abs(prix - medians[codes])
+    counts, (mad,) = _grouped_quantiles(codes, deviation, n_groups, (0.5,))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = 0.6745 * deviation / mad[codes]
+    flagged = (counts[codes] >= OUTLIER_MIN_COUNT) & (mad[codes] > 0) & (score > OUTLIER_THRESHOLD)
+    outliers = [[] for _ in range(n_groups)]
+    for index in np.nonzero(flagged)[0]:
+        outliers[codes[index]].append({
+            'id': int(ids[index]),
+            'prix': round(float(prix[index]), 2),
+            'score': round(float(score[index]), 2),
+        })
+    return outliers
+
+
+def compute_price_statistics(rows, refreshed_at):
+    """
+    Build unsaved PriceStatistic objects for the marque, modele and annee
+    levels from ``(id, marque, modele, annee, prix, kilometrage)`` rows.
+    """
+    if not rows:
+        return []
+    ids, marques, modeles, annees, prix, km = zip(*rows)
+    ids = np.array(ids, dtype=np.int64)
+    annees = np.array(annees, dtype=np.int64)
+    prix = np.array(prix, dtype=float)
+    km = np.array(km, dtype=float)
+
+    marque_keys, marque_codes = np.unique(np.array(marques, dtype=object), return_inverse=True)
+    modele_keys, modele_codes = np.unique(
+        np.array([f'{marque}\x1f{modele}' for marque, modele in zip(marques, modeles)], dtype=object),
+        return_inverse=True,
+    )
+    annee_keys, annee_codes = np.unique(
+        np.stack([modele_codes, annees], axis=1), axis=0, return_inverse=True
+    )
+    annee_codes = annee_codes.reshape(-1)
+
+    levels = [
+        ('marque', marque_codes, [(key, '', None) for key in marque_keys]),
+        ('modele', modele_codes, [tuple(key.split('\x1f', 1)) + (None,) for key in modele_keys]),
+        ('annee', annee_codes, [
+            tuple(modele_keys[modele].split('\x1f', 1)) + (int(annee),) for modele, annee in annee_keys
+        ]),
+    ]
+
+    statistics = []
+    for level, codes, keys in levels:
+        n_groups = len(keys)
+        counts, (p10, p25, median, p75, p90) = _grouped_quantiles(codes, prix, n_groups, QUANTILES)
+        means = np.bincount(codes, prix, n_groups) / counts
+        if level == 'annee':
+            slopes = [None] * n_groups
+            curves = [[] for _ in range(n_groups)]
+        else:
+            slopes = _km_slopes(codes, km, prix, n_groups)
+            curves = _km_curves(codes, km, prix, n_groups)
+        if level == 'modele':
+            outliers = _outliers(codes, ids, prix, median, n_groups)
+        else:
+            outliers = [[] for _ in range(n_groups)]
+        for i, (marque, modele, annee) in enumerate(keys):
+            statistics.append(PriceStatistic(
+                level=level,
+                marque=marque,
+                modele=modele,
+                annee=annee,
+                count=int(counts[i]),
+                mean=round(float(means[i]), 2),
+                median=round(float(median[i]), 2),
+                p10=round(float(p10[i]), 2),
+                p25=round(float(p25[i]), 2),
+                p75=round(float(p75[i]), 2),
+                p90=round(float(p90[i]), 2),
+                km_slope=slopes[i],
+                depreciation=curves[i],
+                outliers=outliers[i],
+                refreshed_at=refreshed_at,
+            ))
+    return statistics
+
+
+def stale_marques():
+    """
+    Return the brands whose statistics are out of date, or None when no
+    statistics have been materialized yet.
+    """
+    watermark = PriceStatistic.objects.aggregate(Max('refreshed_at'))['refreshed_at__max']
+    if watermark is None:
+        return None
+    stale = set(
+        Car.objects.filter(updated_at__gte=watermark).values_list('marque', flat=True).distinct()
+    )
+    # Counts catch deletions, which leave no updated_at trace.
+    current = dict(Car.objects.values('marque').annotate(n=Count('id')).values_list('marque', 'n'))
+    recorded = dict(PriceStatistic.objects.filter(level='marque').values_list('marque', 'count'))
+    stale.update(
+        marque for marque in current.keys() | recorded.keys()
+        if current.get(marque) != recorded.get(marque)
+    )
+    return stale
+
+
+def refresh_price_statistics(full=False):
+    """
+    Recompute the materialized statistics. Returns the number of brands
+    refreshed (all of them on a full refresh).
+    """
+    refreshed_at = timezone.now()
+    marques = None if full else stale_marques()
+    if marques is not None and not marques:
+        return 0
+
+    cars = Car.objects.all()
+    if marques is not None:
+        cars = cars.filter(marque__in=marques)
+    statistics = compute_price_statistics(list(cars.values_list(*FIELDS)), refreshed_at)
+
+    with transaction.atomic():
+        existing = PriceStatistic.objects.all()
+        if marques is not None:
+            existing = existing.filter(marque__in=marques)
+        existing.delete()
+        PriceStatistic.objects.bulk_create(statistics, batch_size=500)
+    return len({statistic.marque for statistic in statistics}) if marques is None else len(marques)
@@ -9,3 +9,6 @@ class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
     verbose_name = 'Star Auto API'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,149 @@
+"""
+Star Auto - Hot/Cold Archival
+
+Moves sold cars and old read messages out of the live Car and Message
+tables into ArchivedCar and ArchivedMessage, in batches and following
+the retention policies in ARCHIVE. The archive models can live in their
+own database (ARCHIVE['DATABASE'], routed by ArchiveRouter), which keeps
+the live tables and the queries scanning them small.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import ArchivedCar, ArchivedMessage, Car, CarHistory, Message, SearchAlert, User
+
+
+DEFAULTS = {
+    'DATABASE': DEFAULT_DB_ALIAS,
+    'CAR_RETENTION_DAYS': 90,
+    'MESSAGE_RETENTION_DAYS': 180,
+    'BATCH_SIZE': 500,
+}
+
+ARCHIVE_MODELS = {'archivedcar', 'archivedmessage'}
+
+
+def archive_settings():
+    """Return ARCHIVE settings merged with defaults."""
+    return {**DEFAULTS, **getattr(settings, 'ARCHIVE', {})}
+
+
+class ArchiveRouter:
+    """Keeps the archive models, and only them, in ARCHIVE['DATABASE']."""
+
+    def _database(self, model):
+        if model._meta.app_label == 'api' and model._meta.model_name in ARCHIVE_MODELS:
+            return archive_settings()['DATABASE']
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._database(model)
+
+    def db_for_write(self, model, **hints):
+        return self._database(model)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        archive_db = archive_settings()['DATABASE']
+        if app_label == 'api' and model_name in ARCHIVE_MODELS:
+            return db == archive_db
+        if db == archive_db and archive_db != DEFAULT_DB_ALIAS:
+            return False
+        return None
+
+
+def archivable_cars(now=None):
+    """
+    Cars sold (unavailable, untouched) for longer than the retention period.
+    A car stays live while live messages still refer to it or saved search
+    alerts about it are still waiting to be mailed.
+    """
+    cutoff = (now or timezone.now()) - timedelta(days=archive_settings()['CAR_RETENTION_DAYS'])
+    return Car.objects.filter(disponibilite=False, updated_at__lt=cutoff).filter(
+        ~Exists(Message.objects.filter(voiture=OuterRef('pk'))),
+        ~Exists(SearchAlert.objects.filter(car=OuterRef('pk'), notified_at__isnull=True)),
+    )
+
+
+def archivable_messages(now=None):
+    """Read messages older than the retention period."""
+    cutoff = (now or timezone.now()) - timedelta(days=archive_settings()['MESSAGE_RETENTION_DAYS'])
+    return Message.objects.filter(lu=True, created_at__lt=cutoff)
+
+
+def _archived_copy(instance, archive_model, extra):
+    return archive_model(**{
+        field.attname: getattr(instance, field.attname)
+        for field in archive_model._meta.concrete_fields if field.name not in ('archived_at', *extra)
+    }, **extra)
+
+
+def _car_related_data(cars):
+    """
+    The rows deleting ``cars`` cascades to that the archive keeps: their
+    history entries and the ids of the users who favorited them.
+    """
+    data = {car.pk: {'history': [], 'favorited_by': []} for car in cars}
+    entries = CarHistory.objects.filter(car__in=data).order_by('car', 'changed_at')
+    for entry in entries.values('car_id', 'changed_at', 'ancien_prix', 'prix', 'disponibilite'):
+        data[entry.pop('car_id')]['history'].append(entry)
+    favorites = User.favorites.through.objects.filter(car_id__in=data).order_by('user_id')
+    for car_id, user_id in favorites.values_list('car_id', 'user_id'):
+        data[car_id]['favorited_by'].append(user_id)
+    return data
+
+
+def move_to_archive(queryset, archive_model, batch_size):
+    """
+    Copy the rows of ``queryset`` to ``archive_model`` and delete them, one
+    primary key batch at a time. Each batch is read again, locked, copied
+    and deleted in one transaction, so a row changed since (e.g. a relisted
+    car) is neither copied nor deleted; copies of already archived ids are
+    skipped, so an interrupted run can simply be started again. Returns
+    the number of rows moved.
+    """
+    database = archive_settings()['DATABASE']
+    moved, last_pk = 0, None
+    while True:
+        candidates = queryset.order_by('pk')
+        if last_pk is not None:
+            candidates = candidates.filter(pk__gt=last_pk)
+        pks = list(candidates.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return moved
+        with transaction.atomic(), transaction.atomic(using=database):
+            batch = list(queryset.filter(pk__in=pks).select_for_update())
+            related = _car_related_data(batch) if queryset.model is Car else {}
+            archive_model.objects.using(database).bulk_create(
+                [_archived_copy(instance, archive_model, related.get(instance.pk, {})) for instance in batch],
+                ignore_conflicts=True,
+            )
+            if related:
+                # Mailed alerts are only worth keeping while the car is listed.
+                SearchAlert.objects.filter(car__in=related).delete()
+            # A regular delete: signals record tombstones and update indexes and snapshots.
+            queryset.filter(pk__in=[instance.pk for instance in batch]).delete()
+        moved += len(batch)
+        last_pk = pks[-1]
+
+
+def run_archival(dry_run=False, batch_size=None):
+    """
+    Archive old read messages, then sold cars (which may only have become
+    archivable once their messages moved). Returns ``{'messages': n, 'cars': n}``.
+    """
+    batch_size = batch_size or archive_settings()['BATCH_SIZE']
+    now = timezone.now()
+    if dry_run:
+        return {
+            'messages': archivable_messages(now).count(),
+            'cars': archivable_cars(now).count(),
+        }
+    return {
+        'messages': move_to_archive(archivable_messages(now), ArchivedMessage, batch_size),
+        'cars': move_to_archive(archivable_cars(now), ArchivedCar, batch_size),
+    }
@@ -0,0 +1,130 @@
+"""
+Star Auto - Audit Log
+
+Records admin mutations (actor, action, object and field diff) as
+AuditEntry rows. Entries are queued in memory once the mutation commits
+and written by a background timer with one bulk_create per batch, so
+audited requests do no extra INSERT. Entries still queued when a process
+dies are lost; the atexit hook flushes them on a normal shutdown.
+"""
+
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import AuditEntry
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 2.0,
+}
+
+CREATE, UPDATE, DELETE = 'create', 'update', 'delete'
+
+# Never diffed: bookkeeping that changes on every save.
+IGNORED_FIELDS = {'updated_at', 'last_login'}
+
+# Diffed without their values.
+MASKED_FIELDS = {'password'}
+MASK = '***'
+
+
+def audit_settings():
+    """Return AUDIT_LOG settings merged with defaults."""
+    return {**DEFAULTS, **getattr(settings, 'AUDIT_LOG', {})}
+
+
+def snapshot(instance):
+    """Return ``{attname: value}`` of the instance's audited fields."""
+    return {
+        field.attname: field.value_from_object(instance)
+        for field in instance._meta.concrete_fields
+        if not field.primary_key and field.attname not in IGNORED_FIELDS
+    }
+
+
+def field_changes(before, after):
+    """Return ``{field: [old, new]}`` for the fields that differ."""
+    before, after = before or {}, after or {}
+    changes = {}
+    for name in sorted(before.keys() | after.keys()):
+        old, new = before.get(name), after.get(name)
+        if old != new:
+            changes[name] = [MASK, MASK] if name in MASKED_FIELDS else [old, new]
+    return changes
+
+
+class AuditLogBuffer:
+    """
+    Collects unsaved entries and writes them with a single bulk_create
+    from a timer thread, FLUSH_INTERVAL seconds after the first entry or
+    right away once BATCH_SIZE entries are waiting.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.flush)
+
+    def add(self, entry):
+        config = audit_settings()
+        with self._lock:
+            self._pending.append(entry)
+            full = len(self._pending) >= config['BATCH_SIZE']
+            if full or self._timer is None:
+                if self._timer is not None:
+                    self._timer.cancel()
+                self._timer = threading.Timer(0 if full else config['FLUSH_INTERVAL'], self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if pending:
+            AuditEntry.objects.bulk_create(pending, batch_size=audit_settings()['BATCH_SIZE'])
+        return len(pending)
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Audit log flush failed')
+        finally:
+            # The timer thread owns its own database connection.
+            connection.close()
+
+
+audit_log = AuditLogBuffer()
+
+
+def record(actor, action, instance, before=None, after=None, object_id=None):
+    """
+    Queue an entry for ``instance`` once the current transaction commits.
+    ``before`` and ``after`` are snapshots; updates that changed nothing
+    are not recorded. Pass ``object_id`` for deleted instances.
+    """
+    if not audit_settings()['ENABLED']:
+        return
+    changes = field_changes(before, after)
+    if action == UPDATE and not changes:
+        return
+    entry = AuditEntry(
+        actor_id=actor.pk if actor is not None and actor.is_authenticated else None,
+        action=action,
+        model=instance._meta.model_name,
+        object_id=instance.pk if object_id is None else object_id,
+        changes=changes,
+    )
+    transaction.on_commit(lambda: audit_log.add(entry))
@@ -0,0 +1,213 @@
+"""
+Star Auto - Brand and Model Autocomplete
+
+Suggests brands and models for the search box from an in-process prefix
+index: the distinct brands and (brand, model) pairs of the catalogue,
+with their car counts, under accent-folded lowercase keys kept in a
+sorted list searched with bisect. Multi-word names are also indexed from
+each word ("benz" finds "Mercedes-Benz") and models under "brand model"
+("bmw x" finds the X5). Model signals keep the counts current, so a
+lookup never touches the database; the index is rebuilt in the
+background every MAX_AGE seconds to pick up other processes' writes.
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+
+from .models import Car
+
+
+DEFAULTS = {
+    'LIMIT': 8,
+    'MAX_LIMIT': 20,
+    'MAX_AGE': 300.0,
+}
+
+WORD_START = re.compile(r'(?<=[\s\-/])\S')
+
+
+def autocomplete_settings():
+    """Return AUTOCOMPLETE settings merged with defaults."""
+    return {**DEFAULTS, **getattr(settings, 'AUTOCOMPLETE', {})}
+
+
+def normalize(text):
+    """Lowercase, accent-folded and whitespace-collapsed: 'Citroën  C4' -> 'citroen c4'."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    folded = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(folded.lower().split())
+
+
+def index_keys(name):
+    """The full name and each suffix starting at a word: 'mercedes-benz' -> also 'benz'."""
+    return {name} | {name[match.start():] for match in WORD_START.finditer(name)}
+
+
+class Suggestion:
+    """A brand (modele is '') or a model, with its car count and spellings."""
+
+    __slots__ = ('marque', 'modele', 'count', 'spellings')
+
+    def __init__(self, marque, modele):
+        self.marque = marque
+        self.modele = modele
+        self.count = 0
+        self.spellings = Counter()
+
+    def keys(self):
+        if not self.modele:
+            return index_keys(self.marque)
+        return index_keys(self.modele) | {f'{self.marque} {self.modele}'}
+
+    def as_dict(self):
+        # The most common spelling of the normalized name.
+        marque, modele = self.spellings.most_common(1)[0][0] if self.spellings else (self.marque, self.modele)
+        if not self.modele:
+            return {'type': 'marque', 'marque': marque, 'count': self.count}
+        return {'type': 'modele', 'marque': marque, 'modele': modele, 'count': self.count}
+
+
+class AutocompleteIndex:
+    """Sorted ``(key, suggestion id)`` list over the brands and models."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.built = False
+        self.rebuilding = False
+        # Changes signalled while a build reads the catalogue, replayed on the new index.
+        self._pending = None
+
+    # Building
+
+    def build(self):
+        """
+        Count the cars of every brand and model spelling. The rows are read
+        outside the lock: the changes signalled meanwhile are recorded and
+        replayed on the new index. A change committed just before the read
+        may then be counted twice, until the next rebuild.
+        """
+        with self._lock:
+            self._pending = []
+        try:
+            rows = list(Car.objects.values_list('marque', 'modele').annotate(count=Count('id')).order_by())
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self.suggestions = {}
+            self.keys = []
+            for marque, modele, count in rows:
+                self._add(marque, modele, count, sort=False)
+            self.keys.sort()
+            for marque, modele, delta in pending:
+                self._add(marque, modele, delta)
+            self.built_at = time.monotonic()
+            self.built = True
+
+    def _rebuild_in_background(self):
+        try:
+            self.build()
+        finally:
+            self.rebuilding = False
+            # The rebuild thread owns its own database connection.
+            connection.close()
+
+    def _ensure_fresh(self):
+        with self._lock:
+            if not self.built:
+                self.build()
+                return
+            if self.rebuilding or time.monotonic() - self.built_at < autocomplete_settings()['MAX_AGE']:
+                return
+            self.rebuilding = True
+        threading.Thread(target=self._rebuild_in_background, name='autocomplete', daemon=True).start()
+
+    # Incremental updates
+
+    def _add(self, marque, modele, delta, sort=True):
+        brand, model = normalize(marque), normalize(modele)
+        entries = [((brand, ''), (marque, ''))]
+        if model:
+            entries.append(((brand, model), (marque, modele)))
+        for suggestion_id, spelling in entries:
+            suggestion = self.suggestions.get(suggestion_id)
+            if suggestion is None:
+                if delta <= 0:
+                    continue
+                suggestion = self.suggestions[suggestion_id] = Suggestion(*suggestion_id)
+                for key in suggestion.keys():
+                    if sort:
+                        insort(self.keys, (key, suggestion_id))
+                    else:
+                        self.keys.append((key, suggestion_id))
+            suggestion.count += delta
+            suggestion.spellings[spelling] += delta
+            suggestion.spellings += Counter()  # drops spellings no car uses anymore
+            if suggestion.count <= 0:
+                del self.suggestions[suggestion_id]
+                for key in suggestion.keys():
+                    self.keys.pop(bisect_left(self.keys, (key, suggestion_id)))
+
+    def _change(self, marque, modele, delta):
+        self._add(marque, modele, delta)
+        if self._pending is not None:
+            self._pending.append((marque, modele, delta))
+
+    def car_saved(self, car, created):
+        """Count a new car, or move an edited one to its new brand/model."""
+        with self._lock:
+            if not self.built:
+                return
+            if created:
+                self._change(car.marque, car.modele, 1)
+                return
+            changes = car.tracked_changes('marque', 'modele')
+            if changes:
+                old_marque = changes.get('marque', (car.marque,))[0]
+                old_modele = changes.get('modele', (car.modele,))[0]
+                self._change(old_marque, old_modele, -1)
+                self._change(car.marque, car.modele, 1)
+
+    def car_deleted(self, car):
+        with self._lock:
+            if self.built:
+                self._change(car.marque, car.modele, -1)
+
+    # Lookup
+
+    def suggest(self, query, limit):
+        """
+        Return up to ``limit`` suggestions for the typed prefix: names
+        starting with it before names with a word starting with it, then
+        by car count.
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        self._ensure_fresh()
+        with self._lock:
+            ranks = {}
+            for position in range(bisect_left(self.keys, (prefix,)), len(self.keys)):
+                key, suggestion_id = self.keys[position]
+                if not key.startswith(prefix):
+                    break
+                suggestion = self.suggestions[suggestion_id]
+                full = key in (suggestion_id[1] or suggestion_id[0], f'{suggestion_id[0]} {suggestion_id[1]}')
+                rank = (0 if full else 1, -suggestion.count, suggestion_id)
+                if ranks.get(suggestion_id, rank) >= rank:
+                    ranks[suggestion_id] = rank
+            best = sorted(ranks, key=ranks.get)[:limit]
+            return [self.suggestions[suggestion_id].as_dict() for suggestion_id in best]
+
+
+autocomplete = AutocompleteIndex()
@@ -0,0 +1,190 @@
+"""
+Star Auto - Batch Requests
+
+Runs several API calls sent in one POST /api/batch/ request. The caller
+is authenticated once and sub-requests are dispatched straight to the
+views of api/urls.py, skipping middleware and the per-request JWT decode.
+Sub-requests run in order on the request's own database connection;
+when the client asks for it, consecutive read-only ones run in parallel
+on a small pool of worker threads.
+"""
+
+import io
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpRequest, QueryDict, StreamingHttpResponse
+from django.urls import Resolver404, resolve
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MAX_REQUESTS': 20,
+    'MAX_WORKERS': 4,
+}
+
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE')
+READ_ONLY_METHODS = ('GET', 'HEAD')
+
+# Routes that would block a worker or recurse.
+EXCLUDED_ROUTES = {'batch', 'events_stream', 'events_poll'}
+
+# Headers that describe the outer request body or credentials.
+DROPPED_META = {
+    'wsgi.input', 'CONTENT_LENGTH', 'CONTENT_TYPE', 'QUERY_STRING',
+    'PATH_INFO', 'REQUEST_METHOD', 'HTTP_AUTHORIZATION', 'HTTP_COOKIE',
+}
+
+
+class InvalidBatch(ValueError):
+    """The batch payload is malformed or too large."""
+
+
+def batch_settings():
+    """Return BATCH_REQUESTS settings merged with defaults."""
+    return {**DEFAULTS, **getattr(settings, 'BATCH_REQUESTS', {})}
+
+
+class SubRequest(HttpRequest):
+    """One call of a batch, sharing the caller's identity and connection details."""
+
+    def __init__(self, parent, method, path, query, body):
+        super().__init__()
+        self.parent = parent
+        self.method = method
+        self.path = self.path_info = path
+        self.META = {key: value for key, value in parent.META.items() if key not in DROPPED_META}
+        self.META.update(REQUEST_METHOD=method, PATH_INFO=path, QUERY_STRING=query)
+        self.GET = QueryDict(query)
+        content = b'' if body is None else json.dumps(body).encode('utf-8')
+        if content:
+            self.META.update(CONTENT_TYPE='application/json', CONTENT_LENGTH=str(len(content)))
+        self._stream = io.BytesIO(content)
+        self._read_started = False
+
+    def _get_scheme(self):
+        return self.parent.scheme
+
+
+def parse_batch(data):
+    """Validate the payload and return ``[(method, path, query, body)]``."""
+    if not isinstance(data, dict) or not isinstance(data.get('requests'), list):
+        raise InvalidBatch('Le champ "requests" doit être une liste.')
+    items = data['requests']
+    limit = batch_settings()['MAX_REQUESTS']
+    if not items or len(items) > limit:
+        raise InvalidBatch(f'Un lot doit contenir entre 1 et {limit} requêtes.')
+
+    parsed = []
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise InvalidBatch('Chaque requête doit indiquer un chemin.')
+        method = str(item.get('method', 'GET')).upper()
+        if method not in METHODS:
+            raise InvalidBatch(f'Méthode non autorisée : {method}.')
+        url = urlsplit(item['path'])
+        path = '/' + url.path.lstrip('/')
+        if path.startswith('/api/'):
+            path = path[len('/api'):]
+        parsed.append((method, path, url.query, item.get('body')))
+    return parsed
+
+
+def _resolve(path):
+    """Resolve against api/urls.py, adding the trailing slash if it is missing."""
+    try:
+        return resolve(path, urlconf='api.urls'), path
+    except Resolver404:
+        if path.endswith('/'):
+            raise
+        return resolve(path + '/', urlconf='api.urls'), path + '/'
+
+
+def run_one(request, method, path, query, body):
+    """Dispatch one sub-request and return ``{'status': ..., 'body': ...}``."""
+    try:
+        match, path = _resolve(path)
+    except Resolver404:
+        return {'status': 404, 'body': {'message': 'Ressource introuvable.'}}
+    if match.url_name in EXCLUDED_ROUTES:
+        return {'status': 400, 'body': {'message': 'Cette route ne peut pas être appelée dans un lot.'}}
+
+    sub = SubRequest(request._request, method, '/api' + path, query, body)
+    sub.resolver_match = match
+    if request.user.is_authenticated:
+        # Read by DRF's Request: the caller is already authenticated.
+        sub._force_auth_user = request.user
+        sub._force_auth_token = request.auth
+
+    try:
+        response = match.func(sub, *match.args, **match.kwargs)
+    except Exception:
+        logger.exception('Batch sub-request %s %s failed', method, path)
+        return {'status': 500, 'body': {'message': 'Erreur interne du serveur.'}}
+
+    if isinstance(response, StreamingHttpResponse):
+        return {'status': 400, 'body': {'message': 'Cette route ne peut pas être appelée dans un lot.'}}
+    if hasattr(response, 'data'):
+        content = response.data
+    elif response.content and response.get('Content-Type', '').startswith('application/json'):
+        content = json.loads(response.content)
+    else:
+        content = response.content.decode(response.charset or 'utf-8')
+    return {'status': response.status_code, 'body': content}
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=batch_settings()['MAX_WORKERS'], thread_name_prefix='batch'
+            )
+    return _executor
+
+
+def _run_in_worker(request, method, path, query, body):
+    # Mirror the request_started/request_finished connection handling.
+    close_old_connections()
+    try:
+        return run_one(request, method, path, query, body)
+    finally:
+        close_old_connections()
+
+
+def run_batch(request, items, parallel=False):
+    """
+    Run the parsed sub-requests and return their responses in order.
+    Writes always run alone, in order; with ``parallel`` each run of
+    consecutive reads is spread over the worker pool.
+    """
+    parallel = parallel and batch_settings()['MAX_WORKERS'] > 0
+    responses = []
+    reads = []
+
+    def flush_reads():
+        if len(reads) > 1:
+            futures = [get_executor().submit(_run_in_worker, request, *item) for item in reads]
+            responses.extend(future.result() for future in futures)
+        elif reads:
+            responses.append(run_one(request, *reads[0]))
+        reads.clear()
+
+    for item in items:
+        if parallel and item[0] in READ_ONLY_METHODS:
+            reads.append(item)
+            continue
+        flush_reads()
+        responses.append(run_one(request, *item))
+    flush_reads()
+    return responses
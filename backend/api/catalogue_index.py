@@ -0,0 +1,265 @@
+"""
+Star Auto - Columnar Catalogue Index
+
+Optional in-process index answering the CarViewSet list filters, sorts
+and pagination without querying the database: the cars are held in
+NumPy column arrays (prix, annee, created_at, categorical codes for
+marque and modele), filters are vectorized masks and sorts argsorts, and
+only the cars of the requested page are then read by primary key. Model
+signals keep the index current for this process; writes from other
+processes are picked up through the updated_at watermark and the
+CarDeletion tombstones. Queries the index cannot answer exactly return
+None and go through the ORM.
+"""
+
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+
+from .models import Car, CarDeletion
+
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SYNC_INTERVAL': 5.0,
+    'SETTLE_SECONDS': 2,
+}
+
+FIELDS = ('id', 'marque', 'modele', 'annee', 'prix', 'created_at', 'updated_at')
+
+# sort parameter -> (column, descending); anything else sorts by -created_at.
+SORTS = {
+    'price-asc': ('prix', False),
+    'price-desc': ('prix', True),
+    'year-desc': ('annee', True),
+    'year-asc': ('annee', False),
+}
+
+# Sorts on columns kept up to date outside of model signals and updated_at.
+UNSUPPORTED_SORTS = {'popular'}
+
+
+def catalogue_index_settings():
+    """Return CATALOGUE_INDEX settings merged with defaults."""
+    return {**DEFAULTS, **getattr(settings, 'CATALOGUE_INDEX', {})}
+
+
+class UnsupportedQuery(Exception):
+    """The query must be answered by the ORM."""
+
+
+class Categories:
+    """Codes of the distinct values of a text column."""
+
+    def __init__(self):
+        self.values = []
+        self.lowered = []
+        self.codes = {}
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+            self.lowered.append(value.lower())
+        return code
+
+    def containing(self, term):
+        """Boolean array over the codes: does the value contain ``term`` (icontains)?"""
+        term = term.lower()
+        return np.fromiter((term in value for value in self.lowered), dtype=bool, count=len(self.lowered))
+
+
+def _decimal(value):
+    try:
+        return float(Decimal(value))
+    except (InvalidOperation, ValueError) as exc:
+        raise UnsupportedQuery(value) from exc
+
+
+class CatalogueIndex:
+    """Column arrays of every car, with a free list for deleted rows."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.built = False
+
+    # Building
+
+    def build(self):
+        """Load every car."""
+        last_deletion = CarDeletion.objects.aggregate(last=Max('id'))['last'] or 0
+        rows = list(Car.objects.values_list(*FIELDS))
+        with self._lock:
+            self.marques = Categories()
+            self.modeles = Categories()
+            size = len(rows)
+            self._allocate_arrays(max(16, size * 2))
+            self.size = size
+            self.free = []
+            self.positions = {}
+            for pos, row in enumerate(rows):
+                self._set(pos, row)
+            self.watermark = max((row[6] for row in rows), default=None)
+            self.last_deletion = last_deletion
+            self.synced = time.monotonic()
+            self.built = True
+
+    def _allocate_arrays(self, capacity):
+        self.capacity = capacity
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.prix = np.zeros(capacity)
+        self.annee = np.zeros(capacity, dtype=np.int64)
+        self.created_at = np.zeros(capacity)
+        self.marque = np.zeros(capacity, dtype=np.int32)
+        self.modele = np.zeros(capacity, dtype=np.int32)
+
+    def _columns(self):
+        return (self.ids, self.active, self.prix, self.annee, self.created_at, self.marque, self.modele)
+
+    def _grow(self):
+        old = self._columns()
+        self._allocate_arrays(self.capacity * 2)
+        for new_array, old_array in zip(self._columns(), old):
+            new_array[:len(old_array)] = old_array
+
+    def _set(self, pos, row):
+        car_id, marque, modele, annee, prix, created_at, _ = row
+        self.positions[car_id] = pos
+        self.ids[pos] = car_id
+        self.active[pos] = True
+        self.prix[pos] = float(prix)
+        self.annee[pos] = annee
+        self.created_at[pos] = created_at.timestamp()
+        self.marque[pos] = self.marques.code(marque)
+        self.modele[pos] = self.modeles.code(modele)
+
+    # Incremental updates
+
+    def _upsert(self, row):
+        pos = self.positions.get(row[0])
+        if pos is None:
+            if self.free:
+                pos = self.free.pop()
+            else:
+                if self.size == self.capacity:
+                    self._grow()
+                pos = self.size
+                self.size += 1
+        self._set(pos, row)
+
+    def _remove(self, car_id):
+        pos = self.positions.pop(car_id, None)
+        if pos is None:
+            return
+        self.active[pos] = False
+        self.ids[pos] = -1
+        self.free.append(pos)
+
+    def update_cars(self, cars):
+        """Insert or refresh saved cars."""
+        with self._lock:
+            if self.built:
+                for car in cars:
+                    self._upsert(tuple(getattr(car, field) for field in FIELDS))
+
+    def remove_car(self, car_id):
+        """Drop a deleted car."""
+        with self._lock:
+            if self.built:
+                self._remove(car_id)
+
+    def sync(self):
+        """
+        Build on first use, then at most every SYNC_INTERVAL seconds apply
+        the cars changed and deleted by other processes. Rows changed just
+        before the watermark are read again, in case their transaction
+        committed after an earlier sync.
+        """
+        config = catalogue_index_settings()
+        with self._lock:
+            if not self.built:
+                self.build()
+                return
+            if time.monotonic() - self.synced < config['SYNC_INTERVAL']:
+                return
+            deletions = list(
+                CarDeletion.objects.filter(id__gt=self.last_deletion).values_list('id', 'car_id')
+            )
+            changed = Car.objects.all()
+            if self.watermark is not None:
+                changed = changed.filter(updated_at__gte=self.watermark - timedelta(seconds=config['SETTLE_SECONDS']))
+            for row in changed.values_list(*FIELDS):
+                self._upsert(row)
+                # Only advanced here: cars saved by this process say nothing of the others.
+                if self.watermark is None or row[6] > self.watermark:
+                    self.watermark = row[6]
+            for deletion_id, car_id in deletions:
+                self._remove(car_id)
+                self.last_deletion = max(self.last_deletion, deletion_id)
+            self.synced = time.monotonic()
+
+    # Queries
+
+    def search(self, params):
+        """
+        Return the ids of the cars matching the CarViewSet list parameters,
+        in list order, or None if the ORM has to answer.
+        """
+        sort = params.get('sort')
+        if sort in UNSUPPORTED_SORTS:
+            return None
+        self.sync()
+        with self._lock:
+            try:
+                rows = np.nonzero(self._mask(params))[0]
+            except UnsupportedQuery:
+                return None
+            created_at = self.created_at[rows]
+            if sort in SORTS:
+                column, descending = SORTS[sort]
+                values = getattr(self, column)[rows]
+                # Ties keep the default order: newest first.
+                order = np.lexsort((-created_at, -values if descending else values))
+            else:
+                order = np.argsort(-created_at, kind='stable')
+            return self.ids[rows[order]]
+
+    def _mask(self, params):
+        size = self.size
+        mask = self.active[:size].copy()
+
+        marque = params.get('marque')
+        if marque:
+            mask &= self.marques.containing(marque)[self.marque[:size]]
+
+        annee = params.get('annee')
+        if annee:
+            try:
+                mask &= self.annee[:size] == int(annee)
+            except ValueError as exc:
+                raise UnsupportedQuery(annee) from exc
+
+        min_price = params.get('minPrice')
+        if min_price:
+            mask &= self.prix[:size] >= _decimal(min_price)
+        max_price = params.get('maxPrice')
+        if max_price:
+            mask &= self.prix[:size] <= _decimal(max_price)
+
+        search = params.get('search')
+        if search:
+            mask &= (
+                self.marques.containing(search)[self.marque[:size]]
+                | self.modeles.containing(search)[self.modele[:size]]
+            )
+        return mask
+
+
+catalogue_index = CatalogueIndex()
@@ -0,0 +1,115 @@
+"""
+Star Auto - Catalogue Change Feed
+
+Lets sync clients fetch only the cars created, updated or deleted since
+their last sync. Cars are paged by the (updated_at, id) index; deletions
+come from the CarDeletion tombstone log. The cursor is an opaque token
+carrying both positions.
+"""
+
+import base64
+import json
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Car, CarDeletion
+
+
+DEFAULTS = {
+    'PAGE_SIZE': 100,
+    'MAX_PAGE_SIZE': 1000,
+    'TOMBSTONE_RETENTION_DAYS': 30,
+    'SETTLE_SECONDS': 2,
+}
+
+
+class InvalidCursor(ValueError):
+    """The cursor could not be decoded."""
+
+
+class ExpiredCursor(Exception):
+    """The cursor predates the tombstone retention window."""
+
+
+def change_feed_settings():
+    """Return CHANGE_FEED settings merged with defaults."""
+    return {**DEFAULTS, **getattr(settings, 'CHANGE_FEED', {})}
+
+
+def encode_cursor(updated_at, car_id, deletion_id, issued_at):
+    payload = {
+        't': updated_at.isoformat() if updated_at else None,
+        'c': car_id,
+        'd': deletion_id,
+        'i': issued_at.isoformat(),
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+
+
+def _aware_datetime(value):
+    moment = datetime.fromisoformat(value)
+    # encode_cursor always writes an offset: a naive one was not issued here.
+    if timezone.is_naive(moment):
+        raise ValueError(f'naive datetime: {value}')
+    return moment
+
+
+def decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        updated_at = _aware_datetime(payload['t']) if payload['t'] else None
+        return updated_at, int(payload['c']), int(payload['d']), _aware_datetime(payload['i'])
+    except (ValueError, KeyError, TypeError) as exc:
+        raise InvalidCursor(str(exc)) from exc
+
+
+def get_changes(cursor=None, limit=None):
+    """
+    Return ``(cars, deleted_ids, next_cursor, has_more)`` for changes after
+    ``cursor``; without a cursor the whole catalogue is returned page by page.
+    """
+    config = change_feed_settings()
+    if limit is not None and limit < 0:
+        raise ValueError(f'negative limit: {limit}')
+    limit = min(limit or config['PAGE_SIZE'], config['MAX_PAGE_SIZE'])
+    now = timezone.now()
+    # Rows written in the last moments may still be committing out of order.
+    horizon = now - timedelta(seconds=config['SETTLE_SECONDS'])
+
+    updated_at, car_id, deletion_id, issued_at = None, 0, 0, now
+    if cursor:
+        updated_at, car_id, deletion_id, issued_at = decode_cursor(cursor)
+        if issued_at < now - timedelta(days=config['TOMBSTONE_RETENTION_DAYS']):
+            raise ExpiredCursor()
+
+    cars = Car.objects.filter(updated_at__lte=horizon)
+    if updated_at is not None:
+        cars = cars.filter(
+            Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=car_id)
+        )
+    cars = list(cars.order_by('updated_at', 'id')[:limit + 1])
+
+    deletions = list(
+        CarDeletion.objects.filter(id__gt=deletion_id, deleted_at__lte=horizon)
+        .order_by('id').values_list('id', 'car_id')[:limit + 1]
+    )
+
+    has_more = len(cars) > limit or len(deletions) > limit
+    cars, deletions = cars[:limit], deletions[:limit]
+    if cars:
+        updated_at, car_id = cars[-1].updated_at, cars[-1].id
+    if deletions:
+        deletion_id = deletions[-1][0]
+
+    next_cursor = encode_cursor(updated_at, car_id, deletion_id, now)
+    return cars, [deleted for _, deleted in deletions], next_cursor, has_more
+
+
+def prune_tombstones():
+    """Delete tombstones older than the retention window; return how many."""
+    cutoff = timezone.now() - timedelta(days=change_feed_settings()['TOMBSTONE_RETENTION_DAYS'])
+    deleted, _ = CarDeletion.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
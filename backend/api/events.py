@@ -0,0 +1,245 @@
+"""
+Star Auto - Live Event Broker
+
+In-process publish/subscribe for inventory and inbox events. Events get
+increasing ids and are kept in a bounded buffer so clients can resume
+from their last id, either through a server-sent events stream (ASGI) or
+through long polling (WSGI). The backend is pluggable through
+EVENTS['BACKEND']; CacheBroker shares events between processes through
+the Django cache.
+
+Streams end after MAX_STREAM_DURATION seconds and the client reconnects
+with Last-Event-ID: Django 4.2 does not cancel a streaming response when
+the client goes away, so an unbounded stream would keep its listener
+forever. EventSource cannot send headers, so streams are authenticated
+with a short-lived ticket signed for this purpose only, never with the
+access token itself.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+DEFAULTS = {
+    'BACKEND': 'api.events.LocalBroker',
+    'BUFFER_SIZE': 1000,
+    'POLL_TIMEOUT': 25,
+    'HEARTBEAT': 15,
+    'CACHE_ALIAS': 'default',
+    'CACHE_POLL_INTERVAL': 1.0,
+    'MAX_STREAM_DURATION': 300,
+    'TICKET_TTL': 60,
+}
+
+TICKET_SALT = 'api.events.stream-ticket'
+
+INVENTORY = 'inventory'
+INBOX = 'inbox'
+CHANNELS = (INVENTORY, INBOX)
+
+
+def events_settings():
+    """Return EVENTS settings merged with defaults."""
+    return {**DEFAULTS, **getattr(settings, 'EVENTS', {})}
+
+
+class EventBroker:
+    """
+    Base broker. Subclasses implement ``_store`` and ``since``; waiting is
+    done by polling unless a subclass can be notified directly.
+    """
+
+    poll_interval = 0.5
+
+    def publish(self, channel, event_type, data):
+        """Store an event and wake up waiting subscribers."""
+        return self._store({'channel': channel, 'type': event_type, 'data': data})
+
+    def _store(self, event):
+        raise NotImplementedError
+
+    def since(self, after, channels):
+        """Return buffered events with an id greater than ``after``."""
+        raise NotImplementedError
+
+    def wait(self, after, channels, timeout):
+        """Block until events arrive or ``timeout`` seconds pass."""
+        deadline = time.monotonic() + timeout
+        while True:
+            events = self.since(after, channels)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                return events
+            time.sleep(min(self.poll_interval, remaining))
+
+    async def listen(self, after, channels, heartbeat):
+        """Yield lists of new events, or an empty list every ``heartbeat`` seconds."""
+        waited = 0.0
+        while True:
+            events = self.since(after, channels)
+            if events:
+                after = events[-1]['id']
+                waited = 0.0
+                yield events
+            elif waited >= heartbeat:
+                waited = 0.0
+                yield []
+            await asyncio.sleep(self.poll_interval)
+            waited += self.poll_interval
+
+
+class LocalBroker(EventBroker):
+    """Per-process broker that notifies waiters as soon as events are published."""
+
+    def __init__(self, buffer_size):
+        self._events = deque(maxlen=buffer_size)
+        self._last_id = 0
+        self._condition = threading.Condition()
+        self._listeners = set()
+
+    def _store(self, event):
+        with self._condition:
+            self._last_id += 1
+            event['id'] = self._last_id
+            self._events.append(event)
+            self._condition.notify_all()
+            listeners = list(self._listeners)
+        for loop, wakeup in listeners:
+            loop.call_soon_threadsafe(wakeup.set)
+        return event
+
+    def since(self, after, channels):
+        with self._condition:
+            # A client resuming with an id from before a restart starts over.
+            if after > self._last_id:
+                after = self._last_id
+            return [
+                event for event in self._events
+                if event['id'] > after and event['channel'] in channels
+            ]
+
+    def wait(self, after, channels, timeout):
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                events = self.since(after, channels)
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self._condition.wait(remaining)
+
+    async def listen(self, after, channels, heartbeat):
+        wakeup = asyncio.Event()
+        listener = (asyncio.get_running_loop(), wakeup)
+        with self._condition:
+            self._listeners.add(listener)
+        try:
+            while True:
+                wakeup.clear()
+                events = self.since(after, channels)
+                if events:
+                    after = events[-1]['id']
+                    yield events
+                    continue
+                try:
+                    await asyncio.wait_for(wakeup.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield []
+        finally:
+            with self._condition:
+                self._listeners.discard(listener)
+
+
+class CacheBroker(EventBroker):
+    """Broker storing events in a shared Django cache; subscribers poll it."""
+
+    prefix = 'events'
+
+    def __init__(self, buffer_size):
+        config = events_settings()
+        self.cache = caches[config['CACHE_ALIAS']]
+        self.buffer_size = buffer_size
+        self.poll_interval = config['CACHE_POLL_INTERVAL']
+
+    def _store(self, event):
+        key = f'{self.prefix}:last'
+        self.cache.add(key, 0, timeout=None)
+        event['id'] = self.cache.incr(key)
+        self.cache.set(f"{self.prefix}:{event['id']}", event, timeout=3600)
+        return event
+
+    def since(self, after, channels):
+        last = self.cache.get(f'{self.prefix}:last', 0)
+        if after > last:
+            after = last
+        first = max(after, last - self.buffer_size) + 1
+        keys = [f'{self.prefix}:{event_id}' for event_id in range(first, last + 1)]
+        found = self.cache.get_many(keys)
+        return [
+            found[key] for key in keys
+            if key in found and found[key]['channel'] in channels
+        ]
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Return the configured broker (created once per process)."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                config = events_settings()
+                _broker = import_string(config['BACKEND'])(config['BUFFER_SIZE'])
+    return _broker
+
+
+def stream_ticket(user):
+    """Return a ticket that authenticates ``user`` on the event stream for TICKET_TTL seconds."""
+    return signing.TimestampSigner(salt=TICKET_SALT).sign(str(user.pk))
+
+
+def ticket_user(ticket):
+    """Return the active user of a valid stream ticket, or None."""
+    try:
+        user_id = signing.TimestampSigner(salt=TICKET_SALT).unsign(ticket, max_age=events_settings()['TICKET_TTL'])
+    except signing.BadSignature:
+        return None
+    return get_user_model().objects.filter(pk=user_id, is_active=True).first()
+
+
+def car_event_data(car):
+    """Public payload for car events."""
+    return {
+        'id': car.pk,
+        'marque': car.marque,
+        'modele': car.modele,
+        'prix': str(car.prix),
+        'disponibilite': car.disponibilite,
+    }
+
+
+def message_event_data(message):
+    """Payload for inbox events."""
+    return {
+        'id': message.pk,
+        'nom': message.nom,
+        'sujet': message.sujet,
+        'voiture': message.voiture_id,
+    }
+
+
+def publish(channel, event_type, data):
+    """Publish an event once the current transaction commits."""
+    transaction.on_commit(lambda: get_broker().publish(channel, event_type, data))
@@ -0,0 +1,105 @@
+"""
+Star Auto - Price and Availability History
+
+Appends a CarHistory row whenever a car's price or availability actually
+changes: on save, from the values the car was loaded with, and for bulk
+admin edits, from the values read just before the UPDATE, written with
+one bulk insert. Rows only hold the values that changed. Timelines are
+read through the (car, changed_at) index and recent price drops through
+a partial index on the rows where the price went down.
+"""
+
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Car, CarHistory
+
+
+TRACKED_FIELDS = ('prix', 'disponibilite')
+
+
+def history_entry(car_id, changes, changed_at=None):
+    """Build the CarHistory row for ``{field: (old, new)}``, or None if nothing changed."""
+    changes = {name: change for name, change in changes.items() if name in TRACKED_FIELDS}
+    if not changes:
+        return None
+    entry = CarHistory(car_id=car_id, changed_at=changed_at or timezone.now())
+    if 'prix' in changes:
+        entry.ancien_prix, entry.prix = changes['prix']
+    if 'disponibilite' in changes:
+        entry.disponibilite = changes['disponibilite'][1]
+    return entry
+
+
+def record_changes(car, changes):
+    """Record the changes of a saved car (from ``Car.tracked_changes``)."""
+    entry = history_entry(car.pk, changes, car.updated_at)
+    if entry is not None:
+        entry.save()
+
+
+def tracked_values(queryset):
+    """Return ``{pk: (prix, disponibilite)}``, read before a bulk update."""
+    return {pk: values for pk, *values in queryset.values_list('pk', *TRACKED_FIELDS)}
+
+
+def record_bulk_changes(previous, changed_at=None):
+    """
+    Diff the cars of ``previous`` (from ``tracked_values``) against their
+    current values in one pass and insert the changes in bulk. Returns the
+    number of rows written.
+    """
+    changed_at = changed_at or timezone.now()
+    entries = []
+    for pk, *current in Car.objects.filter(pk__in=list(previous)).values_list('pk', *TRACKED_FIELDS):
+        changes = {
+            name: (old, new)
+            for name, old, new in zip(TRACKED_FIELDS, previous[pk], current) if old != new
+        }
+        entry = history_entry(pk, changes, changed_at)
+        if entry is not None:
+            entries.append(entry)
+    CarHistory.objects.bulk_create(entries, batch_size=500)
+    return len(entries)
+
+
+def price_timeline(car):
+    """
+    Return the car's successive ``{'date', 'prix', 'disponibilite'}`` states,
+    from its listing to now. The listed values are rebuilt from the first
+    change of each field.
+    """
+    entries = list(car.history.order_by('changed_at'))
+    prix = next((entry.ancien_prix for entry in entries if entry.prix is not None), car.prix)
+    disponibilite = next(
+        (not entry.disponibilite for entry in entries if entry.disponibilite is not None), car.disponibilite
+    )
+    timeline = [{'date': car.created_at, 'prix': prix, 'disponibilite': disponibilite}]
+    for entry in entries:
+        if entry.prix is not None:
+            prix = entry.prix
+        if entry.disponibilite is not None:
+            disponibilite = entry.disponibilite
+        timeline.append({'date': entry.changed_at, 'prix': prix, 'disponibilite': disponibilite})
+    return timeline
+
+
+def recent_price_drops(days, limit):
+    """
+    Return the latest price drop of each available car repriced down in the
+    last ``days`` days, most recent first, reading only the drop rows.
+    """
+    drops = (
+        CarHistory.objects.filter(prix__lt=F('ancien_prix'), changed_at__gte=timezone.now() - timedelta(days=days))
+        .filter(car__disponibilite=True)
+        .select_related('car')
+        .order_by('-changed_at')
+    )
+    latest = {}
+    for drop in drops.iterator(chunk_size=limit):
+        latest.setdefault(drop.car_id, drop)
+        if len(latest) >= limit:
+            break
+    return list(latest.values())
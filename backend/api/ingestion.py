@@ -0,0 +1,336 @@
+"""
+Star Auto - Contact Message Ingestion
+
+Protects the public contact form: token-bucket throttles per IP and per
+email, content-hash deduplication within a time window and optional
+write batching through ``bulk_create``.
+"""
+
+import atexit
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from rest_framework.throttling import BaseThrottle
+
+from . import events
+from .models import Message
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'THROTTLE_BACKEND': 'local',
+    'CACHE_ALIAS': 'default',
+    'IP_RATE': '10/hour',
+    'IP_BURST': 5,
+    'EMAIL_RATE': '5/hour',
+    'EMAIL_BURST': 3,
+    'DEDUP_WINDOW': 600,
+    'BATCH_WRITES': False,
+    'BATCH_SIZE': 50,
+    'BATCH_INTERVAL': 2.0,
+}
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Batched messages whose writes failed this many times are dropped.
+MAX_FLUSH_ATTEMPTS = 3
+
+
+def ingestion_settings():
+    """Return MESSAGE_INGESTION settings merged with defaults."""
+    return {**DEFAULTS, **getattr(settings, 'MESSAGE_INGESTION', {})}
+
+
+def parse_rate(rate):
+    """Convert a '<count>/<period>' rate into tokens per second."""
+    count, period = rate.split('/')
+    return int(count) / DURATIONS[period[0]]
+
+
+class LocalIngestionStore:
+    """Per-process store for token buckets and message fingerprints."""
+
+    max_keys = 10000
+
+    def __init__(self):
+        self._buckets = {}
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate, now):
+        """Take one token from the bucket; return seconds to wait (0 if allowed)."""
+        with self._lock:
+            tokens, stamp = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - stamp) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / rate
+            if len(self._buckets) > self.max_keys:
+                self._prune_buckets(capacity, rate, now)
+            return wait
+
+    def claim(self, fingerprint, window, now):
+        """Record a fingerprint; return False if it was seen within the window."""
+        with self._lock:
+            expires = self._fingerprints.get(fingerprint)
+            if expires is not None and expires > now:
+                return False
+            self._fingerprints[fingerprint] = now + window
+            if len(self._fingerprints) > self.max_keys:
+                self._fingerprints = {
+                    key: value for key, value in self._fingerprints.items() if value > now
+                }
+            return True
+
+    def release(self, fingerprint):
+        """Forget a fingerprint whose message could not be written."""
+        with self._lock:
+            self._fingerprints.pop(fingerprint, None)
+
+    def _prune_buckets(self, capacity, rate, now):
+        # Buckets that have refilled completely carry no state worth keeping.
+        self._buckets = {
+            key: (tokens, stamp) for key, (tokens, stamp) in self._buckets.items()
+            if tokens + (now - stamp) * rate < capacity
+        }
+
+
+class CacheIngestionStore:
+    """
+    Store backed by a Django cache, shared by every worker using it. A
+    bucket is read and written under a per-key lock taken with cache.add,
+    so concurrent workers cannot both spend its last token.
+    """
+
+    prefix = 'ingestion'
+    lock_timeout = 2
+    lock_wait = 0.5
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def consume(self, key, capacity, rate, now):
+        cache_key = f'{self.prefix}:bucket:{key}'
+        lock_key = f'{cache_key}:lock'
+        deadline = time.monotonic() + self.lock_wait
+        while not self.cache.add(lock_key, 1, timeout=self.lock_timeout):
+            if time.monotonic() > deadline:
+                # Heavily contended key: refuse rather than over-admit.
+                return 1 / rate
+            time.sleep(0.005)
+        try:
+            tokens, stamp = self.cache.get(cache_key, (capacity, now))
+            tokens = min(capacity, tokens + (now - stamp) * rate)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self.cache.set(cache_key, (tokens, now), timeout=int(capacity / rate) + 1)
+            return wait
+        finally:
+            self.cache.delete(lock_key)
+
+    def claim(self, fingerprint, window, now):
+        return self.cache.add(f'{self.prefix}:dedup:{fingerprint}', 1, timeout=window)
+
+    def release(self, fingerprint):
+        self.cache.delete(f'{self.prefix}:dedup:{fingerprint}')
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the configured ingestion store (created once per process)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = ingestion_settings()
+                if config['THROTTLE_BACKEND'] == 'cache':
+                    _store = CacheIngestionStore(config['CACHE_ALIAS'])
+                else:
+                    _store = LocalIngestionStore()
+    return _store
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Base token-bucket throttle; subclasses define the key and settings."""
+
+    rate_setting = None
+    burst_setting = None
+
+    def get_key(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        key = self.get_key(request)
+        if key is None:
+            return True
+        config = ingestion_settings()
+        self._wait = get_store().consume(
+            key,
+            config[self.burst_setting],
+            parse_rate(config[self.rate_setting]),
+            time.time(),
+        )
+        return self._wait == 0
+
+    def wait(self):
+        return getattr(self, '_wait', None)
+
+
+class MessageIPThrottle(TokenBucketThrottle):
+    """Limit contact messages per client IP."""
+
+    rate_setting = 'IP_RATE'
+    burst_setting = 'IP_BURST'
+
+    def get_key(self, request):
+        return f'ip:{self.get_ident(request)}'
+
+
+class MessageEmailThrottle(TokenBucketThrottle):
+    """Limit contact messages per sender email."""
+
+    rate_setting = 'EMAIL_RATE'
+    burst_setting = 'EMAIL_BURST'
+
+    def get_key(self, request):
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        if not email:
+            return None
+        return f'email:{str(email).strip().lower()}'
+
+
+def message_fingerprint(data):
+    """Hash the sender, target car and normalized content of a message."""
+    voiture = data.get('voiture')
+    parts = [
+        str(data.get('email', '')).strip().lower(),
+        str(getattr(voiture, 'pk', voiture) or ''),
+        ' '.join(str(data.get('sujet', '')).lower().split()),
+        ' '.join(str(data.get('message', '')).lower().split()),
+    ]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def claim_message(data):
+    """Return True if the message is new within the deduplication window."""
+    window = ingestion_settings()['DEDUP_WINDOW']
+    if not window:
+        return True
+    return get_store().claim(message_fingerprint(data), window, time.time())
+
+
+def release_message(data):
+    """Undo claim_message for a message that was not written, so a resend is accepted."""
+    if ingestion_settings()['DEDUP_WINDOW']:
+        get_store().release(message_fingerprint(data))
+
+
+def message_data(message):
+    """The fingerprinted fields of an unsaved Message."""
+    return {
+        'email': message.email,
+        'voiture': message.voiture_id,
+        'sujet': message.sujet,
+        'message': message.message,
+    }
+
+
+class MessageWriteBuffer:
+    """
+    Collects unsaved messages and writes them with a single bulk_create,
+    either when the batch is full or after BATCH_INTERVAL seconds. A batch
+    that fails is written again one message at a time; messages that keep
+    failing are requeued up to MAX_FLUSH_ATTEMPTS times, then dropped and
+    their dedup claims released.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.flush)
+
+    def add(self, message):
+        config = ingestion_settings()
+        with self._lock:
+            self._pending.append(message)
+            full = len(self._pending) >= config['BATCH_SIZE']
+            if not full and self._timer is None:
+                self._timer = threading.Timer(config['BATCH_INTERVAL'], self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+        try:
+            Message.objects.bulk_create(pending, batch_size=ingestion_settings()['BATCH_SIZE'])
+        except Exception:
+            logger.exception('Message batch write failed, retrying one by one')
+            return self._write_each(pending)
+        # bulk_create sends no post_save, so announce the messages here.
+        for message in pending:
+            events.publish(events.INBOX, 'message.created', events.message_event_data(message))
+        return len(pending)
+
+    def _write_each(self, pending):
+        written, failed = 0, []
+        for message in pending:
+            message.pk = None
+            try:
+                message.save(force_insert=True)
+                written += 1
+            except Exception:
+                message.flush_attempts = getattr(message, 'flush_attempts', 0) + 1
+                failed.append(message)
+        retry = [message for message in failed if message.flush_attempts < MAX_FLUSH_ATTEMPTS]
+        for message in failed:
+            if message.flush_attempts >= MAX_FLUSH_ATTEMPTS:
+                logger.error('Dropping a contact message after %d failed writes', message.flush_attempts)
+                release_message(message_data(message))
+        if retry:
+            with self._lock:
+                self._pending[:0] = retry
+            self._schedule()
+        return written
+
+    def _schedule(self):
+        with self._lock:
+            if self._timer is None and self._pending:
+                self._timer = threading.Timer(ingestion_settings()['BATCH_INTERVAL'], self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Message batch flush failed')
+        finally:
+            # The timer thread owns its own database connection.
+            connection.close()
+
+
+message_buffer = MessageWriteBuffer()
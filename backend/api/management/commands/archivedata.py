@@ -0,0 +1,28 @@
+"""
+Management command to move sold cars and old read messages to the archive.
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.archive import run_archival
+
+
+class Command(BaseCommand):
+    help = 'Moves sold cars and old read messages past their retention period to the archive tables'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count what would be archived'
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            help='Rows moved per batch (default: ARCHIVE["BATCH_SIZE"])'
+        )
+    
+    def handle(self, *args, **options):
+        counts = run_archival(dry_run=options['dry_run'], batch_size=options['batch_size'])
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {counts['messages']} messages and {counts['cars']} cars"
+        ))
@@ -0,0 +1,26 @@
+"""
+Management command to render the static catalogue snapshots.
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.snapshots import build_snapshots, export_frontend_cars, snapshot_root
+
+
+class Command(BaseCommand):
+    help = 'Renders catalogue listings and car details to precompressed JSON files under STATIC_ROOT'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--frontend-export', metavar='PATH',
+            help='Also write the frontend cars.json (e.g. ../frontend/data/cars.json)'
+        )
+    
+    def handle(self, *args, **options):
+        files, written = build_snapshots()
+        self.stdout.write(self.style.SUCCESS(
+            f'{files} snapshots in {snapshot_root()} ({written} new or changed)'
+        ))
+        if options['frontend_export']:
+            count = export_frontend_cars(options['frontend_export'])
+            self.stdout.write(self.style.SUCCESS(f'Exported {count} cars to {options["frontend_export"]}'))
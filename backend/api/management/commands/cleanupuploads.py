@@ -0,0 +1,24 @@
+"""
+Management command to delete abandoned uploads and unreferenced images.
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.uploads import cleanup
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired upload sessions and images no car has referred to for the grace period'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count what would be deleted'
+        )
+    
+    def handle(self, *args, **options):
+        counts = cleanup(dry_run=options['dry_run'])
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {counts['sessions']} upload sessions and {counts['images']} images"
+        ))
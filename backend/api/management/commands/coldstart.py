@@ -0,0 +1,72 @@
+"""
+Management command to benchmark serverless cold starts.
+
+Each run starts a fresh interpreter that imports the WSGI application and
+serves one request, which is what a new serverless instance pays for.
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+PROBE = '''
+import json, os, sys, time
+started = time.perf_counter()
+os.environ['DJANGO_SETTINGS_MODULE'] = sys.argv[1]
+from wsgiref.util import setup_testing_defaults
+from starauto.wsgi import application
+imported = time.perf_counter()
+environ = {'PATH_INFO': sys.argv[2], 'HTTP_HOST': 'localhost'}
+setup_testing_defaults(environ)
+result = {}
+def start_response(status, headers, exc_info=None):
+    result['status'] = status
+b''.join(application(environ, start_response))
+served = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'request': served - imported,
+    'status': result['status'],
+    'modules': len(sys.modules),
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measures cold start time (import + first request) in fresh processes'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--settings-module', action='append', dest='settings_modules',
+            help='Settings module to measure (repeatable, default: current settings)'
+        )
+        parser.add_argument('--path', default='/api/cars/', help='Path of the first request')
+        parser.add_argument('--runs', type=int, default=5, help='Number of cold starts per settings module')
+    
+    def handle(self, *args, **options):
+        modules = options['settings_modules'] or [settings.SETTINGS_MODULE]
+        for module in modules:
+            samples = []
+            for _ in range(options['runs']):
+                started = time.perf_counter()
+                output = subprocess.run(
+                    [sys.executable, '-c', PROBE, module, options['path']],
+                    cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+                ).stdout
+                sample = json.loads(output.strip().splitlines()[-1])
+                sample['total'] = time.perf_counter() - started
+                samples.append(sample)
+            
+            self.stdout.write(self.style.SUCCESS(f'{module} ({samples[0]["status"]}, {samples[0]["modules"]} modules)'))
+            for key in ('import', 'request', 'total'):
+                values = [sample[key] * 1000 for sample in samples]
+                self.stdout.write(
+                    f'  {key:<8} median {statistics.median(values):7.1f} ms'
+                    f'   min {min(values):7.1f} ms   max {max(values):7.1f} ms'
+                )
@@ -0,0 +1,62 @@
+"""
+Management command to report where start-up import time goes.
+"""
+
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)')
+
+
+class Command(BaseCommand):
+    help = 'Reports import time of the WSGI application by package and by module (python -X importtime)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--settings-module', default=None,
+            help='Settings module to import with (default: current settings)'
+        )
+        parser.add_argument('--top', type=int, default=15, help='Number of rows per table')
+    
+    def handle(self, *args, **options):
+        module = options['settings_module'] or settings.SETTINGS_MODULE
+        code = (
+            'import os; '
+            f'os.environ["DJANGO_SETTINGS_MODULE"] = {module!r}; '
+            'from starauto.wsgi import application; '
+            'from django.urls import get_resolver; '
+            'get_resolver().url_patterns'
+        )
+        stderr = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stderr
+        
+        modules = []
+        packages = defaultdict(int)
+        for line in stderr.splitlines():
+            match = LINE.match(line)
+            if not match:
+                continue
+            self_us, cumulative_us, _, name = match.groups()
+            modules.append((int(cumulative_us), int(self_us), name))
+            packages[name.split('.')[0]] += int(self_us)
+        
+        total = sum(packages.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'{module}: {len(modules)} modules imported in {total / 1000:.1f} ms'
+        ))
+        
+        self.stdout.write('\nBy package (self time):')
+        for name, self_us in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'  {self_us / 1000:8.1f} ms  {100 * self_us / total:5.1f}%  {name}')
+        
+        self.stdout.write('\nBy module (cumulative time):')
+        for cumulative_us, self_us, name in sorted(modules, reverse=True)[:options['top']]:
+            self.stdout.write(f'  {cumulative_us / 1000:8.1f} ms  {name}')
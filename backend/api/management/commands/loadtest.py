@@ -0,0 +1,402 @@
+"""
+Management command to load test the API with concurrent mixed traffic.
+
+Boots the project locally (WSGI through runserver, or ASGI through
+uvicorn) on a throwaway copy of the SQLite database, or targets a running
+server, then replays a weighted mix of anonymous browsing, logins,
+favoriting, contact messages and admin car edits from concurrent clients,
+each from its own X-Forwarded-For address. Reports throughput, latency percentiles
+and histograms, and error, throttling and SQLite lock-timeout rates per
+endpoint.
+"""
+
+import http.client
+import importlib.util
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import Car, Message, User
+
+
+DEFAULT_MIX = 'browse=70,login=5,favorite=10,message=10,admin_edit=5'
+EMAIL_DOMAIN = 'loadtest.invalid'
+PASSWORD = 'loadtest-password'
+HISTOGRAM_BOUNDS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]  # ms
+LOCKED = b'database is locked'
+
+# Settings of the booted server: the project settings on the database copy,
+# with the contact message throttles lifted unless --throttled.
+SERVER_SETTINGS = """from {module} import *  # noqa: F401,F403
+
+DATABASES = {{**DATABASES, 'default': {{**DATABASES['default'], 'NAME': {database!r}}}}}
+
+# The load test clients stand in for the proxy: trust their X-Forwarded-For.
+REST_FRAMEWORK = {{**REST_FRAMEWORK, 'NUM_PROXIES': 1}}
+"""
+UNTHROTTLED = """
+MESSAGE_INGESTION = {
+    **MESSAGE_INGESTION,
+    'IP_RATE': '1000000/s', 'IP_BURST': 1000000, 'EMAIL_RATE': '1000000/s', 'EMAIL_BURST': 1000000,
+}
+"""
+
+
+class Stats:
+    """Latencies and outcomes per endpoint, shared by the client threads."""
+    
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.outcomes = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+    
+    def record(self, endpoint, latency, outcome):
+        with self._lock:
+            self.latencies[endpoint].append(latency * 1000)
+            self.outcomes[endpoint][outcome] += 1
+
+
+def classify(status, body):
+    if status is None:
+        return 'error'
+    if status == 429:
+        return '429'
+    if status >= 500:
+        return 'locked' if LOCKED in body else '5xx'
+    return f'{status // 100}xx'
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class LoadClient:
+    """One simulated visitor with its own keep-alive connection."""
+    
+    def __init__(self, base_url, stats, user, token, admin_token, cars, rng, address):
+        url = urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.stats = stats
+        self.user = user
+        self.token = token
+        self.admin_token = admin_token
+        self.cars = cars
+        self.rng = rng
+        self.address = address
+        self.connection = None
+        self.sent = 0
+    
+    def request(self, method, path, endpoint, body=None, token=None):
+        # The client IP of the per-IP throttles on the booted server (NUM_PROXIES 1).
+        headers = {'Accept': 'application/json', 'X-Forwarded-For': self.address}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        started = time.perf_counter()
+        status, content = None, b''
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            self.connection.request(method, path, payload, headers)
+            response = self.connection.getresponse()
+            status, content = response.status, response.read()
+            if response.will_close:
+                self.close()
+        except (OSError, http.client.HTTPException):
+            self.close()
+        self.stats.record(f'{method} {endpoint}', time.perf_counter() - started, classify(status, content))
+        return status, content
+    
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+    
+    # Scenarios
+    
+    def browse(self):
+        page = self.rng.randint(1, max(1, len(self.cars) // 10))
+        self.request('GET', f'/api/cars/?page={page}', '/api/cars/')
+        car = self.rng.choice(self.cars)
+        self.request('GET', f'/api/cars/{car["id"]}/', '/api/cars/{id}/')
+        if self.rng.random() < 0.3:
+            self.request('GET', f'/api/cars/?marque={car["marque"]}&sort=price-asc', '/api/cars/?marque=')
+    
+    def login(self):
+        self.request('POST', '/api/auth/login/', '/api/auth/login/', {'email': self.user.email, 'password': PASSWORD})
+    
+    def favorite(self):
+        car = self.rng.choice(self.cars)
+        self.request('POST', f'/api/favorites/{car["id"]}/', '/api/favorites/{id}/', token=self.token)
+        self.request('GET', '/api/favorites/', '/api/favorites/', token=self.token)
+        self.request('DELETE', f'/api/favorites/{car["id"]}/', '/api/favorites/{id}/', token=self.token)
+    
+    def message(self):
+        self.sent += 1
+        car = self.rng.choice(self.cars)
+        self.request('POST', '/api/messages/', '/api/messages/', {
+            'nom': self.user.username,
+            'email': self.user.email,
+            'sujet': 'Test de charge',
+            'message': f'Message {self.sent} de {self.user.username}',
+            'voiture': car['id'],
+        })
+    
+    def admin_edit(self):
+        # What a list_editable save does: rewrite the row with the values it already has.
+        car = self.rng.choice(self.cars)
+        self.request(
+            'PATCH', f'/api/cars/{car["id"]}/', '/api/cars/{id}/',
+            {'disponibilite': car['disponibilite'], 'prix': car['prix']}, token=self.admin_token
+        )
+
+
+class Command(BaseCommand):
+    help = 'Runs concurrent mixed traffic against a local server and reports per-endpoint latency and errors'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--server', choices=['wsgi', 'asgi'], default='wsgi',
+            help='Server to boot: runserver (WSGI) or uvicorn (ASGI)'
+        )
+        parser.add_argument('--url', help='Target an already running server instead of booting one')
+        parser.add_argument('--clients', type=int, default=16, help='Concurrent clients')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds of traffic')
+        parser.add_argument(
+            '--mix', default=DEFAULT_MIX,
+            help=f'Scenario weights (default: {DEFAULT_MIX})'
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument('--histogram', action='store_true', help='Print latency histograms')
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+        parser.add_argument(
+            '--throttled', action='store_true',
+            help='Keep the contact message throttles on the booted server (lifted by default)'
+        )
+        parser.add_argument(
+            '--keep-data', action='store_true',
+            help='Keep the database copy (or, with --url, the load test users and messages) afterwards'
+        )
+    
+    def handle(self, *args, **options):
+        mix = self.parse_mix(options['mix'])
+        workdir = original_database = None
+        if not options['url']:
+            if connection.vendor != 'sqlite':
+                raise CommandError('Booting a server copies the SQLite database: use --url to target another one.')
+            workdir = tempfile.mkdtemp(prefix='loadtest-')
+            original_database = connection.settings_dict['NAME']
+            self.use_copy(original_database, os.path.join(workdir, 'db.sqlite3'))
+        
+        server = log = None
+        try:
+            cars = list(Car.objects.values('id', 'marque', 'prix', 'disponibilite')[:1000])
+            if not cars:
+                raise CommandError('The catalogue is empty: run `python manage.py seeddata` first.')
+            for car in cars:
+                car['prix'] = str(car['prix'])
+            users, admin = self.create_users(options['clients'])
+            admin_token = str(RefreshToken.for_user(admin).access_token)
+            if options['url']:
+                base_url = options['url'].rstrip('/')
+            else:
+                server, log, base_url = self.boot(options['server'], workdir, options['throttled'])
+            stats = Stats()
+            elapsed = self.run_clients(base_url, stats, mix, users, admin_token, cars, options)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(10)
+            if workdir is None:
+                if not options['keep_data']:
+                    self.cleanup()
+            else:
+                connection.close()
+                connection.settings_dict['NAME'] = original_database
+                if options['keep_data']:
+                    self.stdout.write(f'Database copy kept in {workdir}')
+                else:
+                    shutil.rmtree(workdir, ignore_errors=True)
+        
+        server_locks = 0
+        if log is not None:
+            log.seek(0)
+            server_locks = log.read().count(LOCKED)
+            log.close()
+        self.report(stats, elapsed, server_locks, options)
+    
+    def use_copy(self, database, copy):
+        """Copy the SQLite database (consistently, even while in use) and switch to the copy."""
+        source, target = sqlite3.connect(database), sqlite3.connect(copy)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+        connection.close()
+        connection.settings_dict['NAME'] = copy
+    
+    def parse_mix(self, value):
+        mix = {}
+        for part in value.split(','):
+            name, _, weight = part.partition('=')
+            name = name.strip()
+            if not hasattr(LoadClient, name) or name.startswith('_') or name in ('request', 'close'):
+                raise CommandError(f'Unknown scenario: {name}')
+            mix[name] = float(weight or 1)
+        return mix
+    
+    def create_users(self, count):
+        self.cleanup()
+        password = make_password(PASSWORD)
+        User.objects.bulk_create([
+            User(username=f'loadtest-{i}', email=f'loadtest-{i}@{EMAIL_DOMAIN}', password=password)
+            for i in range(count)
+        ])
+        admin = User.objects.create(
+            username='loadtest-admin', email=f'admin@{EMAIL_DOMAIN}', password=password, role='ADMIN'
+        )
+        return list(User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}', role='CLIENT').order_by('id')), admin
+    
+    def cleanup(self):
+        Message.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').delete()
+        User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').delete()
+    
+    def boot(self, kind, workdir, throttled):
+        with open(os.path.join(workdir, 'loadtest_settings.py'), 'w', encoding='utf-8') as module:
+            module.write(SERVER_SETTINGS.format(
+                module=settings.SETTINGS_MODULE, database=connection.settings_dict['NAME']
+            ))
+            if not throttled:
+                module.write(UNTHROTTLED)
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        if kind == 'asgi':
+            if importlib.util.find_spec('uvicorn') is None:
+                raise CommandError('--server asgi needs uvicorn (pip install uvicorn).')
+            command = [sys.executable, '-m', 'uvicorn', 'starauto.asgi:application', '--port', str(port), '--no-access-log']
+        else:
+            command = [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload', '--skip-checks']
+        pythonpath = os.pathsep.join(filter(None, [workdir, str(settings.BASE_DIR), os.environ.get('PYTHONPATH')]))
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'loadtest_settings', 'PYTHONPATH': pythonpath}
+        log = tempfile.TemporaryFile()
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        
+        base_url = f'http://127.0.0.1:{port}'
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'The {kind.upper()} server exited during start-up.')
+            try:
+                probe = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+                probe.request('GET', '/api/cars/')
+                if probe.getresponse().status == 200:
+                    probe.close()
+                    break
+            except OSError:
+                time.sleep(0.2)
+        else:
+            server.terminate()
+            raise CommandError(f'The {kind.upper()} server did not answer within 30 seconds.')
+        self.stdout.write(f'{kind.upper()} server listening on {base_url}')
+        return server, log, base_url
+    
+    def run_clients(self, base_url, stats, mix, users, admin_token, cars, options):
+        scenarios, weights = list(mix), list(mix.values())
+        deadline = time.monotonic() + options['duration']
+        
+        def visitor(index):
+            rng = random.Random(options['seed'] * 1000 + index)
+            user = users[index % len(users)]
+            client = LoadClient(
+                base_url, stats, user, str(RefreshToken.for_user(user).access_token), admin_token, cars, rng,
+                f'10.0.{index // 250}.{index % 250 + 1}',
+            )
+            while time.monotonic() < deadline:
+                getattr(client, rng.choices(scenarios, weights)[0])()
+            client.close()
+        
+        threads = [threading.Thread(target=visitor, args=(i,), daemon=True) for i in range(options['clients'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+    
+    def report(self, stats, elapsed, server_locks, options):
+        outcomes = ['2xx', '3xx', '4xx', '429', '5xx', 'locked', 'error']
+        rows = []
+        for endpoint in sorted(stats.latencies):
+            latencies = sorted(stats.latencies[endpoint])
+            counts = stats.outcomes[endpoint]
+            histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+            for latency in latencies:
+                histogram[sum(latency > bound for bound in HISTOGRAM_BOUNDS)] += 1
+            rows.append({
+                'endpoint': endpoint,
+                'requests': len(latencies),
+                'rps': len(latencies) / elapsed,
+                'p50': percentile(latencies, 0.50),
+                'p90': percentile(latencies, 0.90),
+                'p99': percentile(latencies, 0.99),
+                'max': latencies[-1],
+                'outcomes': {outcome: counts.get(outcome, 0) for outcome in outcomes},
+                'histogram': histogram,
+            })
+        
+        total = sum(row['requests'] for row in rows)
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} requests in {elapsed:.1f} s ({total / elapsed:.1f} req/s), '
+            f'{options["clients"]} clients'
+        ))
+        header = f'{"endpoint":<32} {"reqs":>6} {"req/s":>7} {"p50":>7} {"p90":>7} {"p99":>7} {"max":>7}'
+        self.stdout.write(header + ''.join(f' {outcome:>6}' for outcome in outcomes))
+        for row in rows:
+            line = (
+                f'{row["endpoint"]:<32} {row["requests"]:>6} {row["rps"]:>7.1f}'
+                f' {row["p50"]:>7.1f} {row["p90"]:>7.1f} {row["p99"]:>7.1f} {row["max"]:>7.1f}'
+            )
+            self.stdout.write(line + ''.join(f' {row["outcomes"][outcome]:>6}' for outcome in outcomes))
+        self.stdout.write('Latencies in ms. locked: 5xx caused by "database is locked".')
+        if server_locks:
+            self.stdout.write(self.style.WARNING(f'Server log mentions "database is locked" {server_locks} times'))
+        
+        if options['histogram']:
+            labels = [f'<={bound}' for bound in HISTOGRAM_BOUNDS] + [f'>{HISTOGRAM_BOUNDS[-1]}']
+            for row in rows:
+                self.stdout.write(f'\n{row["endpoint"]}')
+                peak = max(row['histogram']) or 1
+                for label, count in zip(labels, row['histogram']):
+                    if count:
+                        self.stdout.write(f'  {label:>7} ms {count:>7} {"#" * max(1, 40 * count // peak)}')
+        
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as output:
+                json.dump({
+                    'elapsed': elapsed,
+                    'clients': options['clients'],
+                    'histogram_bounds_ms': HISTOGRAM_BOUNDS,
+                    'server_lock_mentions': server_locks,
+                    'endpoints': rows,
+                }, output, indent=2)
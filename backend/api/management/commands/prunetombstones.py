@@ -0,0 +1,15 @@
+"""
+Management command to prune old car deletion tombstones.
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.changefeed import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Deletes change feed tombstones older than the retention window'
+    
+    def handle(self, *args, **options):
+        deleted = prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} tombstones'))
@@ -0,0 +1,15 @@
+"""
+Management command to reconcile the denormalized popularity counters.
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.popularity import recount_popularity
+
+
+class Command(BaseCommand):
+    help = 'Recomputes favorite counts and popularity scores of every car'
+    
+    def handle(self, *args, **options):
+        changed = recount_popularity()
+        self.stdout.write(self.style.SUCCESS(f'Corrected popularity of {changed} cars'))
@@ -0,0 +1,21 @@
+"""
+Management command to refresh the materialized price statistics.
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.analytics import refresh_price_statistics
+
+
+class Command(BaseCommand):
+    help = 'Refreshes price statistics for brands changed since the last refresh'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Recompute statistics for every brand'
+        )
+    
+    def handle(self, *args, **options):
+        refreshed = refresh_price_statistics(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Refreshed price statistics for {refreshed} brands'))
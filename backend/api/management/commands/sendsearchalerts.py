@@ -0,0 +1,15 @@
+"""
+Management command to mail queued saved search alerts.
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.searches import send_alert_emails
+
+
+class Command(BaseCommand):
+    help = 'Mails users the new cars matching their saved searches'
+    
+    def handle(self, *args, **options):
+        users, alerts = send_alert_emails()
+        self.stdout.write(self.style.SUCCESS(f'Sent {alerts} alerts to {users} users'))
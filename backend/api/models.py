@@ -2,11 +2,39 @@
 Star Auto - Django Models
 """
 
+import uuid
+
 from django.db import models
+from django.db.models import F, Q
+from django.db.models.functions import Collate, Upper
+from django.contrib.postgres.indexes import OpClass
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 
 
+class CaseInsensitiveIndex(models.Index):
+    """
+    Single-column index usable by the case-insensitive prefix and exact
+    lookups of admin searches (istartswith, iexact): a NOCASE column index
+    on SQLite, where they compile to LIKE, and an UPPER() expression index
+    with text_pattern_ops on PostgreSQL, where they compile to
+    UPPER(column) LIKE. Other databases get a plain index.
+    """
+    
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        (field,) = self.fields
+        vendor = schema_editor.connection.vendor
+        if vendor == 'sqlite':
+            expression = Collate(F(field), 'NOCASE')
+        elif vendor == 'postgresql':
+            expression = OpClass(Upper(field), name='text_pattern_ops')
+        else:
+            return super().create_sql(model, schema_editor, using=using, **kwargs)
+        index = models.Index(expression, name=self.name)
+        return index.create_sql(model, schema_editor, using=using, **kwargs)
+
+
 class User(AbstractUser):
     """
     Custom User model extending Django's AbstractUser.
@@ -24,6 +52,10 @@ class User(AbstractUser):
     class Meta:
         verbose_name = 'Utilisateur'
         verbose_name_plural = 'Utilisateurs'
+        indexes = [
+            CaseInsensitiveIndex(fields=['username']),
+            CaseInsensitiveIndex(fields=['email']),
+        ]
     
     def __str__(self):
         return self.username
@@ -57,6 +89,10 @@ class Car(models.Model):
     transmission = models.CharField(max_length=20, choices=TRANSMISSION_CHOICES, default='Manuelle')
     couleur = models.CharField(max_length=50, default='Noir')
     disponibilite = models.BooleanField(default=True)
+    # Denormalized counters, maintained in batches by api/popularity.py
+    vues = models.PositiveIntegerField(default=0)
+    nb_favoris = models.PositiveIntegerField(default=0)
+    popularite = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -68,10 +104,99 @@ class Car(models.Model):
             models.Index(fields=['marque', 'modele']),
             models.Index(fields=['annee']),
             models.Index(fields=['prix']),
+            models.Index(fields=['updated_at', 'id']),
+            models.Index(fields=['created_at']),
+            models.Index(fields=['-popularite', '-created_at']),
+            CaseInsensitiveIndex(fields=['marque']),
+            CaseInsensitiveIndex(fields=['modele']),
         ]
     
     def __str__(self):
         return f"{self.annee} {self.marque} {self.modele}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember loaded values so post_save handlers can tell what changed.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields
+        }
+    
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {
+            **getattr(self, '_loaded_values', {}),
+            **{
+                field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields
+                if field.attname not in deferred and (fields is None or field.name in fields or field.attname in fields)
+            },
+        }
+    
+    def tracked_changes(self, *fields):
+        """
+        Return {field: (old, new)} for the given fields changed since the car
+        was loaded. New cars and cars built without loading return {}.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return {}
+        changes = {}
+        for name in fields:
+            if name not in loaded or loaded[name] is models.DEFERRED:
+                continue
+            new = self._meta.get_field(name).to_python(getattr(self, name))
+            if loaded[name] != new:
+                changes[name] = (loaded[name], new)
+        return changes
+
+
+class CarDeletion(models.Model):
+    """
+    Tombstone for a deleted car, read by the change feed.
+    """
+    car_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        verbose_name = 'Suppression de voiture'
+        verbose_name_plural = 'Suppressions de voitures'
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"Voiture {self.car_id} supprimée"
+
+
+class CarHistory(models.Model):
+    """
+    Append-only record of a change of price and/or availability (see
+    api/history.py). Only the changed values are set.
+    """
+    car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='history', db_index=False)
+    changed_at = models.DateTimeField(default=timezone.now)
+    ancien_prix = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    prix = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    disponibilite = models.BooleanField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Historique de voiture'
+        verbose_name_plural = 'Historique des voitures'
+        ordering = ['car', 'changed_at']
+        indexes = [
+            models.Index(fields=['car', 'changed_at']),
+            # Covers the price drop listing without scanning the whole history.
+            models.Index(
+                fields=['-changed_at'], condition=Q(prix__lt=F('ancien_prix')), name='carhistory_price_drop_idx'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.car_id} modifiée le {self.changed_at:%d/%m/%Y %H:%M}"
 
 
 class Message(models.Model):
@@ -91,6 +216,273 @@ class Message(models.Model):
         verbose_name = 'Message'
         verbose_name_plural = 'Messages'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['lu', 'created_at']),
+            CaseInsensitiveIndex(fields=['email']),
+            CaseInsensitiveIndex(fields=['nom']),
+            CaseInsensitiveIndex(fields=['sujet']),
+        ]
     
     def __str__(self):
         return f"Message de {self.nom} - {self.sujet or 'Sans sujet'}"
+
+
+class PriceStatistic(models.Model):
+    """
+    Materialized price statistics for a group of cars (see api/analytics.py).
+    """
+    LEVEL_CHOICES = [
+        ('marque', 'Marque'),
+        ('modele', 'Modèle'),
+        ('annee', 'Année'),
+    ]
+    
+    level = models.CharField(max_length=10, choices=LEVEL_CHOICES)
+    marque = models.CharField(max_length=100)
+    modele = models.CharField(max_length=100, blank=True, default='')
+    annee = models.IntegerField(null=True, blank=True)
+    count = models.IntegerField()
+    mean = models.FloatField()
+    median = models.FloatField()
+    p10 = models.FloatField()
+    p25 = models.FloatField()
+    p75 = models.FloatField()
+    p90 = models.FloatField()
+    km_slope = models.FloatField(null=True, blank=True)
+    depreciation = models.JSONField(default=list, blank=True)
+    outliers = models.JSONField(default=list, blank=True)
+    refreshed_at = models.DateTimeField()
+    
+    class Meta:
+        verbose_name = 'Statistique de prix'
+        verbose_name_plural = 'Statistiques de prix'
+        ordering = ['marque', 'modele', 'annee']
+        indexes = [
+            models.Index(fields=['level', 'marque', 'modele', 'annee']),
+            models.Index(fields=['refreshed_at']),
+        ]
+    
+    def __str__(self):
+        parts = [self.marque, self.modele, str(self.annee or '')]
+        return ' '.join(part for part in parts if part)
+
+
+class SavedSearch(models.Model):
+    """
+    Car search saved by a user to be alerted of new matching listings
+    (see api/searches.py).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='saved_searches')
+    nom = models.CharField(max_length=100, blank=True, default='')
+    marque = models.CharField(max_length=100, blank=True, default='')
+    annee = models.IntegerField(null=True, blank=True)
+    prix_min = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    prix_max = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    carburant = models.CharField(max_length=20, choices=Car.CARBURANT_CHOICES, blank=True, default='')
+    active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Recherche enregistrée'
+        verbose_name_plural = 'Recherches enregistrées'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['updated_at']),
+        ]
+    
+    def __str__(self):
+        return self.nom or f"Recherche {self.pk} de {self.user}"
+
+
+class SearchAlert(models.Model):
+    """
+    Queued notification: a car matching a saved search.
+    """
+    search = models.ForeignKey(SavedSearch, on_delete=models.CASCADE, related_name='alerts')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_alerts')
+    car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='search_alerts')
+    lu = models.BooleanField(default=False)
+    notified_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Alerte de recherche'
+        verbose_name_plural = 'Alertes de recherche'
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['search', 'car'], name='unique_search_alert'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'lu', 'created_at']),
+            models.Index(fields=['notified_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.car} pour {self.user}"
+
+
+class ArchivedCar(models.Model):
+    """
+    Sold car moved out of the Car table (see api/archive.py). Keeps the
+    original id and timestamps, its history and who favorited it.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    marque = models.CharField(max_length=100)
+    modele = models.CharField(max_length=100)
+    annee = models.IntegerField()
+    prix = models.DecimalField(max_digits=10, decimal_places=2)
+    images = models.JSONField(default=list)
+    description = models.TextField()
+    kilometrage = models.IntegerField(default=0)
+    carburant = models.CharField(max_length=20, choices=Car.CARBURANT_CHOICES, default='Essence')
+    transmission = models.CharField(max_length=20, choices=Car.TRANSMISSION_CHOICES, default='Manuelle')
+    couleur = models.CharField(max_length=50, default='Noir')
+    disponibilite = models.BooleanField(default=False)
+    vues = models.PositiveIntegerField(default=0)
+    nb_favoris = models.PositiveIntegerField(default=0)
+    popularite = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    # Kept from the live rows the delete cascades to: CarHistory entries and favoriting user ids.
+    history = models.JSONField(default=list, blank=True, encoder=DjangoJSONEncoder)
+    favorited_by = models.JSONField(default=list, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        verbose_name = 'Voiture archivée'
+        verbose_name_plural = 'Voitures archivées'
+        ordering = ['-archived_at']
+        indexes = [
+            models.Index(fields=['marque', 'modele']),
+            CaseInsensitiveIndex(fields=['marque']),
+            CaseInsensitiveIndex(fields=['modele']),
+        ]
+    
+    def __str__(self):
+        return f"{self.annee} {self.marque} {self.modele}"
+
+
+class ArchivedMessage(models.Model):
+    """
+    Old read message moved out of the Message table (see api/archive.py).
+    ``voiture_id`` may point to a live or an archived car.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    nom = models.CharField(max_length=100)
+    email = models.EmailField()
+    sujet = models.CharField(max_length=200, blank=True, default='')
+    message = models.TextField()
+    telephone = models.CharField(max_length=20, blank=True, default='')
+    voiture_id = models.BigIntegerField(null=True, blank=True)
+    lu = models.BooleanField(default=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        verbose_name = 'Message archivé'
+        verbose_name_plural = 'Messages archivés'
+        ordering = ['-created_at']
+        indexes = [
+            CaseInsensitiveIndex(fields=['email']),
+            CaseInsensitiveIndex(fields=['nom']),
+            models.Index(fields=['created_at']),
+        ]
+    
+    def __str__(self):
+        return f"Message de {self.nom} - {self.sujet or 'Sans sujet'}"
+
+
+class AuditEntry(models.Model):
+    """
+    Admin mutation: who did what to which object, with the changed fields
+    as ``{field: [old, new]}`` (see api/audit.py).
+    """
+    ACTION_CHOICES = [
+        ('create', 'Création'),
+        ('update', 'Modification'),
+        ('delete', 'Suppression'),
+    ]
+    
+    actor = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='audit_entries', db_index=False
+    )
+    action = models.CharField(max_length=6, choices=ACTION_CHOICES)
+    model = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    changes = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = "Entrée d'audit"
+        verbose_name_plural = "Journal d'audit"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['model', 'object_id', 'created_at']),
+            models.Index(fields=['actor', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_action_display()} {self.model} {self.object_id}"
+
+
+class StoredImage(models.Model):
+    """
+    Uploaded image file, stored once under MEDIA_ROOT by its SHA-256 (see
+    api/uploads.py). ``ref_count`` counts the references from Car.images;
+    unreferenced images are purged after a grace period.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    extension = models.CharField(max_length=5)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    orphaned_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Image stockée'
+        verbose_name_plural = 'Images stockées'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return self.name
+    
+    @property
+    def name(self):
+        """Path under MEDIA_ROOT."""
+        return f"images/{self.sha256[:2]}/{self.sha256}.{self.extension}"
+
+
+class UploadSession(models.Model):
+    """
+    Resumable upload in progress: ``offset`` bytes of ``size`` received so
+    far (see api/uploads.py).
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    car = models.ForeignKey(Car, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_sessions')
+    filename = models.CharField(max_length=255, blank=True, default='')
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    # Lease of the PATCH writing the partial file, so concurrent chunks can't interleave.
+    writing_until = models.DateTimeField(null=True, blank=True)
+    image = models.ForeignKey(StoredImage, on_delete=models.SET_NULL, null=True, blank=True, related_name='uploads')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Envoi de fichier'
+        verbose_name_plural = 'Envois de fichiers'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.filename or self.id} ({self.offset}/{self.size})"
+    
+    @property
+    def complete(self):
+        return self.image_id is not None
@@ -0,0 +1,160 @@
+"""
+Star Auto - Popularity Counters
+
+Counts car detail views and favorite changes in memory and adds them to
+the denormalized Car.vues, Car.nb_favoris and Car.popularite columns in
+batched UPDATEs, either on an interval or once enough cars are pending.
+Increments are relative (``F() + delta``), so every process can flush
+its own counts without coordination, and clamped at zero: a removal can
+be flushed before the matching addition from another process.
+recount_popularity reconciles the counters exactly. Sorting by
+popularity then reads the indexed popularite column.
+"""
+
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import Car, User
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'FLUSH_INTERVAL': 10.0,
+    'FLUSH_SIZE': 1000,
+    'FAVORITE_WEIGHT': 10,
+}
+
+
+def popularity_settings():
+    """Return POPULARITY settings merged with defaults."""
+    return {**DEFAULTS, **getattr(settings, 'POPULARITY', {})}
+
+
+def popularity_score(vues, nb_favoris):
+    """Popularity of a car: views plus weighted favorites."""
+    return vues + popularity_settings()['FAVORITE_WEIGHT'] * nb_favoris
+
+
+class PopularityCounters:
+    """
+    Pending view and favorite deltas per car, flushed as one UPDATE per
+    distinct pair of deltas (most pending cars share ``(+1, 0)``).
+    """
+
+    def __init__(self):
+        self._views = Counter()
+        self._favorites = Counter()
+        # Distinct cars with pending deltas, so the size check stays O(1).
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.flush)
+
+    def record_view(self, car_id):
+        self._record(self._views, car_id, 1)
+
+    def record_favorites(self, car_ids, delta):
+        for car_id in car_ids:
+            self._record(self._favorites, car_id, delta)
+
+    def _record(self, counter, car_id, delta):
+        config = popularity_settings()
+        with self._lock:
+            counter[car_id] += delta
+            self._pending.add(car_id)
+            full = len(self._pending) >= config['FLUSH_SIZE']
+            if not full:
+                self._schedule()
+        if full:
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Popularity flush failed')
+
+    def _schedule(self):
+        # Called with the lock held.
+        if self._timer is None:
+            self._timer = threading.Timer(popularity_settings()['FLUSH_INTERVAL'], self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """
+        Write pending deltas; return the number of cars updated. If the
+        write fails, the deltas are put back for the next flush.
+        """
+        with self._lock:
+            views, self._views = self._views, Counter()
+            favorites, self._favorites = self._favorites, Counter()
+            self._pending = set()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        groups = defaultdict(list)
+        for car_id in views.keys() | favorites.keys():
+            deltas = (views[car_id], favorites[car_id])
+            if deltas != (0, 0):
+                groups[deltas].append(car_id)
+        if not groups:
+            return 0
+
+        weight = popularity_settings()['FAVORITE_WEIGHT']
+        try:
+            with transaction.atomic():
+                for (view_delta, favorite_delta), car_ids in groups.items():
+                    # QuerySet.update() leaves updated_at alone: counters are not edits.
+                    Car.objects.filter(pk__in=car_ids).update(
+                        vues=Greatest(F('vues') + view_delta, 0),
+                        nb_favoris=Greatest(F('nb_favoris') + favorite_delta, 0),
+                        popularite=Greatest(F('popularite') + view_delta + weight * favorite_delta, 0),
+                    )
+        except Exception:
+            with self._lock:
+                self._views.update(views)
+                self._favorites.update(favorites)
+                self._pending.update(views.keys() | favorites.keys())
+                self._schedule()
+            raise
+        return sum(len(car_ids) for car_ids in groups.values())
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Popularity flush failed')
+        finally:
+            # The timer thread owns its own database connection.
+            connection.close()
+
+
+popularity = PopularityCounters()
+
+
+def recount_popularity():
+    """
+    Recompute nb_favoris from the favorites table and popularite from the
+    counters, correcting any drift (e.g. deltas lost when a process died
+    before flushing). Returns the number of cars changed.
+    """
+    popularity.flush()
+    counts = dict(
+        User.favorites.through.objects.values('car_id').annotate(n=Count('id')).values_list('car_id', 'n')
+    )
+    changed = []
+    for car in Car.objects.only('id', 'vues', 'nb_favoris', 'popularite').iterator():
+        nb_favoris = counts.get(car.pk, 0)
+        popularite = popularity_score(car.vues, nb_favoris)
+        if (car.nb_favoris, car.popularite) != (nb_favoris, popularite):
+            car.nb_favoris, car.popularite = nb_favoris, popularite
+            changed.append(car)
+    Car.objects.bulk_update(changed, ['nb_favoris', 'popularite'], batch_size=500)
+    return len(changed)
@@ -0,0 +1,362 @@
+"""
+Star Auto - On-Demand Request Profiling
+
+Profiles single requests on demand: an admin adds the ``X-Profile: 1``
+header or the ``?_profile=1`` query flag and the request runs under a
+sampling profiler that records the Python stacks of the request thread
+and every SQL query with its timing. The result is stored as a
+speedscope file (https://www.speedscope.app) next to a JSON summary and
+listed by the admin profile endpoints. Requests without the flag only
+pay for one header and one query string lookup.
+"""
+
+import json
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'DIRECTORY': 'profiles',
+    'INTERVAL': 0.001,
+    'MAX_PROFILES': 50,
+    'MAX_DURATION': 60.0,
+}
+
+HEADER = 'HTTP_X_PROFILE'
+QUERY_FLAG = '_profile'
+FLAG_VALUES = ('1', 'true', 'yes')
+
+# Functions listed by self time in each summary.
+TOP_FUNCTIONS = 15
+
+
+def profiling_settings():
+    """Return PROFILING settings merged with defaults."""
+    return {**DEFAULTS, **getattr(settings, 'PROFILING', {})}
+
+
+def profile_directory():
+    return Path(settings.BASE_DIR, profiling_settings()['DIRECTORY'])
+
+
+def profile_requested(request):
+    """Whether the request carries the profiling flag."""
+    flag = request.META.get(HEADER) or (
+        request.GET.get(QUERY_FLAG) if QUERY_FLAG in request.META.get('QUERY_STRING', '') else None
+    )
+    return bool(flag) and flag.lower() in FLAG_VALUES
+
+
+def request_admin(request):
+    """The admin behind the request (session or JWT), else None."""
+    user = getattr(request, 'user', None)
+    if not (user and user.is_authenticated):
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except (InvalidToken, TokenError, AuthenticationFailed):
+            return None
+        user = result[0] if result else None
+    if user and user.is_authenticated and user.role == 'ADMIN':
+        return user
+    return None
+
+
+class StackSampler(threading.Thread):
+    """Samples the Python stack of one thread every ``interval`` seconds."""
+
+    def __init__(self, thread_id, interval, max_duration):
+        super().__init__(name='profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_duration = max_duration
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        started = last = time.perf_counter()
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None or now - started > self.max_duration:
+                return
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if self._stop_event.is_set():
+                return  # The request is over: the thread is waiting on stop().
+            stack.reverse()
+            # Weighted by the time actually elapsed: the GIL delays samples under load.
+            self.samples.append((now - last, tuple(stack)))
+            last = now
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class QueryRecorder:
+    """Database execute wrapper recording every query and its timing."""
+
+    def __init__(self, started):
+        self.started = started
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            end = time.perf_counter()
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'many': many,
+                'start': round((start - self.started) * 1000, 3),
+                'ms': round((end - start) * 1000, 3),
+            })
+
+
+def speedscope_document(name, samples, queries, duration_ms):
+    """
+    Build a speedscope file: the sampled stacks as one profile and the
+    SQL queries as an evented profile on the same timeline.
+    """
+    frames, frame_index = [], {}
+
+    def index(frame):
+        if frame not in frame_index:
+            function, filename, line = frame
+            frame_index[frame] = len(frames)
+            frames.append({'name': function, 'file': filename, 'line': line})
+        return frame_index[frame]
+
+    profiles = [{
+        'type': 'sampled',
+        'name': f'{name} (Python)',
+        'unit': 'milliseconds',
+        'startValue': 0,
+        'endValue': duration_ms,
+        'samples': [[index(frame) for frame in stack] for _, stack in samples],
+        'weights': [round(weight * 1000, 3) for weight, _ in samples],
+    }]
+    if queries:
+        events = []
+        for query in queries:
+            frame = index((' '.join(query['sql'].split())[:200], f"SQL ({query['alias']})", 0))
+            events.append({'type': 'O', 'frame': frame, 'at': query['start']})
+            events.append({'type': 'C', 'frame': frame, 'at': round(query['start'] + query['ms'], 3)})
+        profiles.append({
+            'type': 'evented',
+            'name': f'{name} (SQL)',
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': max(duration_ms, events[-1]['at']),
+            'events': events,
+        })
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'exporter': 'starauto',
+        'activeProfileIndex': 0,
+        'shared': {'frames': frames},
+        'profiles': profiles,
+    }
+
+
+def top_functions(samples):
+    """Self time per function (the innermost frame of each sample), in ms."""
+    self_time = Counter()
+    for weight, stack in samples:
+        if stack:
+            function, filename, line = stack[-1]
+            self_time[f'{function} ({filename}:{line})'] += weight
+    return [
+        {'function': function, 'ms': round(seconds * 1000, 3)}
+        for function, seconds in self_time.most_common(TOP_FUNCTIONS)
+    ]
+
+
+class ProfileStore:
+    """Profiles on disk: ``<id>.json`` summaries and ``<id>.speedscope.json`` files."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def path(self, profile_id, kind='json'):
+        return self.directory / (f'{profile_id}.speedscope.json' if kind == 'speedscope' else f'{profile_id}.json')
+
+    def new_id(self):
+        # Sorts by creation time.
+        return f"{timezone.now():%Y%m%d-%H%M%S-%f}-{secrets.token_hex(3)}"
+
+    def save(self, summary, document, keep):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profile_id = summary['id']
+        # The speedscope file first: a listed summary always has its file.
+        for kind, content in (('speedscope', document), ('json', summary)):
+            temporary = self.path(profile_id, kind).with_suffix('.tmp')
+            temporary.write_text(json.dumps(content), encoding='utf-8')
+            os.replace(temporary, self.path(profile_id, kind))
+        self.prune(keep)
+
+    def ids(self):
+        if not self.directory.is_dir():
+            return []
+        return sorted(
+            (path.name[:-len('.json')] for path in self.directory.glob('*.json')
+             if not path.name.endswith('.speedscope.json')),
+            reverse=True,
+        )
+
+    def prune(self, keep):
+        for profile_id in self.ids()[keep:]:
+            for kind in ('json', 'speedscope'):
+                self.path(profile_id, kind).unlink(missing_ok=True)
+
+    def load(self, profile_id, kind='json'):
+        """The stored summary or speedscope document, or None."""
+        try:
+            return json.loads(self.path(profile_id, kind).read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return None
+
+    def recent(self, limit=None):
+        summaries = (self.load(profile_id) for profile_id in self.ids()[:limit])
+        return [summary for summary in summaries if summary is not None]
+
+
+def get_store():
+    return ProfileStore(profile_directory())
+
+
+_switch_lock = threading.Lock()
+_switch_state = {'active': 0, 'previous': None}
+
+
+def _lower_switch_interval(interval):
+    """
+    Let the sampler take the GIL as often as it samples; by default the
+    request thread would only give it up every 5 ms while running Python.
+    """
+    with _switch_lock:
+        if not _switch_state['active']:
+            _switch_state['previous'] = sys.getswitchinterval()
+            sys.setswitchinterval(min(interval, _switch_state['previous']))
+        _switch_state['active'] += 1
+
+
+def _restore_switch_interval():
+    with _switch_lock:
+        _switch_state['active'] -= 1
+        if not _switch_state['active']:
+            sys.setswitchinterval(_switch_state['previous'])
+
+
+def profile_call(request, get_response, user):
+    """Run ``get_response(request)`` under the profiler and store the result."""
+    config = profiling_settings()
+    store = get_store()
+    started_at = timezone.now()
+    started = time.perf_counter()
+    recorder = QueryRecorder(started)
+    sampler = StackSampler(threading.get_ident(), config['INTERVAL'], config['MAX_DURATION'])
+
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        _lower_switch_interval(config['INTERVAL'])
+        sampler.start()
+        try:
+            response = get_response(request)
+        finally:
+            sampler.stop()
+            _restore_switch_interval()
+    duration_ms = round((time.perf_counter() - started) * 1000, 3)
+
+    profile_id = store.new_id()
+    name = f'{request.method} {request.get_full_path()}'
+    summary = {
+        'id': profile_id,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': response.status_code,
+        'user': user.email,
+        'created_at': started_at.isoformat(),
+        'duration_ms': duration_ms,
+        'samples': len(sampler.samples),
+        'sql_count': len(recorder.queries),
+        'sql_ms': round(sum(query['ms'] for query in recorder.queries), 3),
+        'top_functions': top_functions(sampler.samples),
+        'queries': recorder.queries,
+    }
+    try:
+        store.save(
+            summary, speedscope_document(name, sampler.samples, recorder.queries, duration_ms), config['MAX_PROFILES']
+        )
+    except OSError:
+        # E.g. a read-only file system: the profiled request still gets its response.
+        logger.exception('Could not save profile %s', profile_id)
+        return response
+    response['X-Profile-Id'] = profile_id
+    return response
+
+
+class ProfilingMiddleware:
+    """
+    Profiles flagged requests of admins. Sync and async capable, so that
+    unflagged requests pass straight through under both WSGI and ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = profiling_settings()['ENABLED']
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not (self.enabled and profile_requested(request)):
+            return self.get_response(request)
+        user = request_admin(request)
+        if user is None:
+            return self.get_response(request)
+        return profile_call(request, self.get_response, user)
+
+    async def __acall__(self, request):
+        if not (self.enabled and profile_requested(request)):
+            return await self.get_response(request)
+        # Run the rest of the chain from one worker thread: the sync views it
+        # reaches are dispatched back onto that thread, which is the one sampled.
+        return await sync_to_async(self._profile_from_thread)(request)
+
+    def _profile_from_thread(self, request):
+        user = request_admin(request)
+        get_response = async_to_sync(self.get_response)
+        if user is None:
+            return get_response(request)
+        return profile_call(request, get_response, user)
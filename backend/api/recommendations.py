@@ -0,0 +1,424 @@
+"""
+Star Auto - Similar Car Recommendations
+
+Keeps an in-process index of the available cars: a NumPy feature matrix
+built from Car attributes, co-favorite counts from User.favorites and a
+precomputed top-K neighbour table. The index is built on first use and
+then updated incrementally from model signals, so a lookup is a single
+row read.
+
+The first lookup starts the build in a background thread and is answered
+from the database meanwhile. Cars saved or deleted by other processes are
+picked up through the updated_at watermark and the CarDeletion
+tombstones, at most every SYNC_INTERVAL seconds; the whole index, with
+other processes' favorites, is rebuilt every REBUILD_INTERVAL seconds.
+"""
+
+import math
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Max
+from django.db.models.functions import Abs
+
+from .models import Car, CarDeletion, User
+
+
+DEFAULTS = {
+    'TOP_K': 8,
+    'COFAVORITE_WEIGHT': 0.5,
+    'SYNC_INTERVAL': 5.0,
+    'SETTLE_SECONDS': 2,
+    'REBUILD_INTERVAL': 3600.0,
+}
+
+FIELDS = ('id', 'marque', 'prix', 'annee', 'kilometrage', 'carburant', 'transmission')
+
+# Feature layout: [log prix, annee, log kilometrage | marque buckets | carburant | transmission]
+NUMERIC_WEIGHTS = np.array([1.0, 0.8, 0.6])
+MARQUE_BUCKETS = 64
+MARQUE_WEIGHT = 1.5
+CARBURANTS = {value: i for i, (value, _) in enumerate(Car.CARBURANT_CHOICES)}
+CARBURANT_WEIGHT = 1.0
+TRANSMISSIONS = {value: i for i, (value, _) in enumerate(Car.TRANSMISSION_CHOICES)}
+TRANSMISSION_WEIGHT = 0.5
+
+MARQUE_OFFSET = len(NUMERIC_WEIGHTS)
+CARBURANT_OFFSET = MARQUE_OFFSET + MARQUE_BUCKETS
+TRANSMISSION_OFFSET = CARBURANT_OFFSET + len(CARBURANTS)
+DIMENSIONS = TRANSMISSION_OFFSET + len(TRANSMISSIONS)
+
+
+def similar_settings():
+    """Return SIMILAR_CARS settings merged with defaults."""
+    return {**DEFAULTS, **getattr(settings, 'SIMILAR_CARS', {})}
+
+
+def marque_bucket(marque):
+    # Hashing keeps the column layout fixed when new brands appear.
+    return zlib.crc32(marque.strip().lower().encode('utf-8')) % MARQUE_BUCKETS
+
+
+def car_row(car):
+    return tuple(getattr(car, field) for field in FIELDS)
+
+
+def fallback_similar(car, limit):
+    """Available cars of the same brand closest in price, while the index is built."""
+    return list(
+        Car.objects.filter(disponibilite=True, marque__iexact=car.marque)
+        .exclude(pk=car.pk)
+        .annotate(gap=Abs(F('prix') - car.prix))
+        .order_by('gap')
+        .values_list('pk', flat=True)[:limit]
+    )
+
+
+class SimilarCarIndex:
+    """Top-K nearest neighbours of every available car."""
+
+    block_size = 1024
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.built = False
+        self.building = False
+
+    # Building
+
+    def build(self):
+        """
+        Load every available car and precompute all neighbour lists into a
+        new index, swapped in once complete; changes made meanwhile are
+        then applied by sync().
+        """
+        fresh = SimilarCarIndex()
+        fresh._load()
+        with self._lock:
+            self.__dict__.update({
+                name: value for name, value in fresh.__dict__.items() if name not in ('_lock', 'building')
+            })
+        self.sync(force=True)
+
+    def _load(self):
+        config = similar_settings()
+        self.last_deletion = CarDeletion.objects.aggregate(last=Max('id'))['last'] or 0
+        self.watermark = Car.objects.aggregate(last=Max('updated_at'))['last']
+        rows = list(Car.objects.filter(disponibilite=True).values_list(*FIELDS))
+        favorites = User.favorites.through.objects.values_list('user_id', 'car_id')
+
+        self.top_k = config['TOP_K']
+        self.cofavorite_weight = config['COFAVORITE_WEIGHT']
+
+        numeric = self._numeric(rows)
+        self.mean = numeric.mean(axis=0) if rows else np.zeros(len(NUMERIC_WEIGHTS))
+        self.std = numeric.std(axis=0) if rows else np.ones(len(NUMERIC_WEIGHTS))
+        self.std[self.std == 0] = 1.0
+
+        size = len(rows)
+        self._allocate_arrays(max(16, size * 2))
+        self.size = size
+        self.free = []
+        self.features[:size] = self._encode(rows)
+        self.ids[:size] = [row[0] for row in rows]
+        self.active[:size] = True
+        self.positions = {row[0]: i for i, row in enumerate(rows)}
+        self.rows = {row[0]: row for row in rows}
+
+        self.cofavorites = defaultdict(Counter)
+        self.favorite_counts = Counter()
+        self.user_favorites = defaultdict(set)
+        for user_id, car_id in favorites:
+            self.user_favorites[user_id].add(car_id)
+        for cars in self.user_favorites.values():
+            self._apply_pairs(cars, 1)
+
+        for start in range(0, size, self.block_size):
+            stop = min(start + self.block_size, size)
+            block = self.features[start:stop] @ self.features[:size].T
+            for offset, pos in enumerate(range(start, stop)):
+                sims = np.full(self.capacity, -np.inf)
+                sims[:size] = block[offset]
+                self._add_cofavorites(sims, self.ids[pos])
+                sims[pos] = -np.inf
+                self.neighbours[pos], self.scores[pos] = self._select(sims)
+
+        self.built_at = self.synced = time.monotonic()
+        self.built = True
+
+    def _build_in_background(self):
+        try:
+            self.build()
+        finally:
+            self.building = False
+            # The build thread owns its own database connection.
+            connection.close()
+
+    def _ensure_fresh(self):
+        """Start a background (re)build when due, otherwise sync; True once the index is usable."""
+        with self._lock:
+            if not self.building and (
+                not self.built or time.monotonic() - self.built_at >= similar_settings()['REBUILD_INTERVAL']
+            ):
+                self.building = True
+                threading.Thread(target=self._build_in_background, name='similar-cars', daemon=True).start()
+            if not self.built:
+                return False
+        self.sync()
+        return True
+
+    def sync(self, force=False):
+        """
+        Apply the cars changed and deleted by other processes, at most every
+        SYNC_INTERVAL seconds. Rows changed just before the watermark are
+        read again, in case their transaction committed after an earlier
+        sync; cars whose features did not change are skipped.
+        """
+        config = similar_settings()
+        with self._lock:
+            if not self.built or (not force and time.monotonic() - self.synced < config['SYNC_INTERVAL']):
+                return
+            deletions = list(
+                CarDeletion.objects.filter(id__gt=self.last_deletion).values_list('id', 'car_id')
+            )
+            changed = Car.objects.only(*FIELDS, 'disponibilite', 'updated_at')
+            if self.watermark is not None:
+                changed = changed.filter(updated_at__gte=self.watermark - timedelta(seconds=config['SETTLE_SECONDS']))
+            for car in changed:
+                if car.disponibilite and self.rows.get(car.pk) == car_row(car):
+                    continue
+                self._update(car)
+                # Only advanced here: cars saved by this process say nothing of the others.
+                if self.watermark is None or car.updated_at > self.watermark:
+                    self.watermark = car.updated_at
+            for deletion_id, car_id in deletions:
+                self._remove_car(car_id)
+                self.last_deletion = max(self.last_deletion, deletion_id)
+            self.synced = time.monotonic()
+
+    def _allocate_arrays(self, capacity):
+        self.capacity = capacity
+        self.features = np.zeros((capacity, DIMENSIONS))
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.neighbours = np.full((capacity, self.top_k), -1, dtype=np.int64)
+        self.scores = np.full((capacity, self.top_k), -np.inf)
+
+    def _grow(self):
+        old = (self.features, self.ids, self.active, self.neighbours, self.scores)
+        self._allocate_arrays(self.capacity * 2)
+        for new_array, old_array in zip(
+            (self.features, self.ids, self.active, self.neighbours, self.scores), old
+        ):
+            new_array[:len(old_array)] = old_array
+
+    # Encoding
+
+    def _numeric(self, rows):
+        numeric = np.array(
+            [(float(row[2]), row[3], row[4]) for row in rows], dtype=float
+        ).reshape(len(rows), len(NUMERIC_WEIGHTS))
+        numeric[:, 0] = np.log1p(np.maximum(numeric[:, 0], 0))
+        numeric[:, 2] = np.log1p(np.maximum(numeric[:, 2], 0))
+        return numeric
+
+    def _encode(self, rows):
+        """Return L2-normalized feature vectors so dot products are cosines."""
+        features = np.zeros((len(rows), DIMENSIONS))
+        if not rows:
+            return features
+        features[:, :MARQUE_OFFSET] = (self._numeric(rows) - self.mean) / self.std * NUMERIC_WEIGHTS
+        for i, row in enumerate(rows):
+            features[i, MARQUE_OFFSET + marque_bucket(row[1])] = MARQUE_WEIGHT
+            if row[5] in CARBURANTS:
+                features[i, CARBURANT_OFFSET + CARBURANTS[row[5]]] = CARBURANT_WEIGHT
+            if row[6] in TRANSMISSIONS:
+                features[i, TRANSMISSION_OFFSET + TRANSMISSIONS[row[6]]] = TRANSMISSION_WEIGHT
+        norms = np.linalg.norm(features, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return features / norms
+
+    # Scoring
+
+    def _apply_pairs(self, cars, sign):
+        cars = list(cars)
+        for car_id in cars:
+            self.favorite_counts[car_id] += sign
+        for i, first in enumerate(cars):
+            for second in cars[i + 1:]:
+                self.cofavorites[first][second] += sign
+                self.cofavorites[second][first] += sign
+        self.favorite_counts += Counter()  # drops non-positive counts
+
+    def _add_cofavorites(self, sims, car_id):
+        partners = self.cofavorites.get(car_id)
+        if not partners or not self.cofavorite_weight:
+            return
+        degree = self.favorite_counts.get(car_id, 0)
+        for other, count in partners.items():
+            pos = self.positions.get(other)
+            if pos is not None and count > 0:
+                sims[pos] += self.cofavorite_weight * count / math.sqrt(
+                    degree * self.favorite_counts[other]
+                )
+
+    def _scores_for(self, vector, car_id):
+        sims = self.features @ vector
+        sims[~self.active] = -np.inf
+        self._add_cofavorites(sims, car_id)
+        pos = self.positions.get(car_id)
+        if pos is not None:
+            sims[pos] = -np.inf
+        return sims
+
+    def _select(self, sims):
+        k = self.top_k
+        ids = np.full(k, -1, dtype=np.int64)
+        scores = np.full(k, -np.inf)
+        if len(sims) > k:
+            best = np.argpartition(-sims, k)[:k]
+        else:
+            best = np.arange(len(sims))
+        found = best[np.isfinite(sims[best])]
+        ids[:len(found)] = self.ids[found]
+        scores[:len(found)] = sims[found]
+        return ids, scores
+
+    def _recompute(self, positions):
+        for pos in positions:
+            car_id = self.ids[pos]
+            sims = self._scores_for(self.features[pos], car_id)
+            self.neighbours[pos], self.scores[pos] = self._select(sims)
+
+    # Incremental updates
+
+    def update_car(self, car):
+        """Insert or refresh a car after it was saved."""
+        with self._lock:
+            if self.built:
+                self._update(car)
+
+    def _update(self, car):
+        if not car.disponibilite:
+            self._remove(car.pk)
+            return
+
+        pos = self.positions.get(car.pk)
+        if pos is None:
+            if self.free:
+                pos = self.free.pop()
+            else:
+                if self.size == self.capacity:
+                    self._grow()
+                pos = self.size
+                self.size += 1
+            self.positions[car.pk] = pos
+            self.ids[pos] = car.pk
+            self.active[pos] = True
+
+        self.rows[car.pk] = car_row(car)
+        self.features[pos] = self._encode([self.rows[car.pk]])[0]
+        sims = self._scores_for(self.features[pos], car.pk)
+        self.neighbours[pos], self.scores[pos] = self._select(sims)
+
+        # Rows already listing the car may now rank it lower: recompute them.
+        stale = np.nonzero((self.neighbours == car.pk).any(axis=1))[0]
+        stale = stale[stale != pos]
+        self._recompute(stale)
+
+        # Rows whose weakest neighbour is beaten by the car take it in place.
+        rows = np.arange(self.capacity)
+        weakest = self.scores.argmin(axis=1)
+        better = self.active & (sims > self.scores[rows, weakest])
+        better[stale] = False
+        better[pos] = False
+        better = np.nonzero(better)[0]
+        self.neighbours[better, weakest[better]] = car.pk
+        self.scores[better, weakest[better]] = sims[better]
+
+    def remove_car(self, car_id):
+        """Drop a deleted car, including its co-favorite history."""
+        with self._lock:
+            if self.built:
+                self._remove_car(car_id)
+
+    def _remove_car(self, car_id):
+        self._remove(car_id)
+        for partner in self.cofavorites.pop(car_id, {}):
+            self.cofavorites[partner].pop(car_id, None)
+        self.favorite_counts.pop(car_id, None)
+        for cars in self.user_favorites.values():
+            cars.discard(car_id)
+
+    def _remove(self, car_id):
+        pos = self.positions.pop(car_id, None)
+        if pos is None:
+            return
+        self.rows.pop(car_id, None)
+        self.active[pos] = False
+        self.features[pos] = 0
+        self.ids[pos] = -1
+        self.neighbours[pos] = -1
+        self.scores[pos] = -np.inf
+        self.free.append(pos)
+        self._recompute(np.nonzero((self.neighbours == car_id).any(axis=1))[0])
+
+    def favorites_changed(self, user_ids=None, car_id=None):
+        """
+        Refresh co-favorite counts for the given users, or for every user
+        who had ``car_id`` in their favorites when the user set is unknown.
+        """
+        with self._lock:
+            if not self.built:
+                return
+            if user_ids is None:
+                user_ids = [
+                    user_id for user_id, cars in self.user_favorites.items() if car_id in cars
+                ]
+            user_ids = list(user_ids)
+            current = defaultdict(set)
+            for user_id, favorite_id in User.favorites.through.objects.filter(
+                user_id__in=user_ids
+            ).values_list('user_id', 'car_id'):
+                current[user_id].add(favorite_id)
+
+            affected = set()
+            for user_id in user_ids:
+                old = self.user_favorites.get(user_id, set())
+                new = current.get(user_id, set())
+                if old == new:
+                    continue
+                self._apply_pairs(old, -1)
+                self._apply_pairs(new, 1)
+                self.user_favorites[user_id] = new
+                changed = old ^ new
+                affected |= old | new
+                for changed_id in changed:
+                    affected.update(self.cofavorites.get(changed_id, ()))
+
+            self._recompute([self.positions[i] for i in affected if i in self.positions])
+
+    # Lookup
+
+    def similar(self, car):
+        """Return the ids of the cars most similar to ``car``, best first."""
+        if not self._ensure_fresh():
+            return fallback_similar(car, similar_settings()['TOP_K'])
+        with self._lock:
+            pos = self.positions.get(car.pk)
+            if pos is not None:
+                ids, scores = self.neighbours[pos], self.scores[pos]
+            else:
+                # Sold cars are not indexed; score them against the index on the fly.
+                ids, scores = self._select(self._scores_for(self._encode([car_row(car)])[0], car.pk))
+            order = np.argsort(-scores, kind='stable')
+            return [int(car_id) for car_id in ids[order] if car_id != -1]
+
+
+similar_cars = SimilarCarIndex()
@@ -0,0 +1,287 @@
+"""
+Star Auto - Saved Search Alerts
+
+Matches new and repriced cars against the users' saved searches. An
+in-process inverted index over brand, fuel and price bucket narrows each
+car down to a few candidate searches, which are then checked exactly
+with the CarViewSet filter rules. Matches are queued as SearchAlert rows
+and mailed by the sendsearchalerts command. The index follows
+SavedSearch changes through an updated_at watermark, so searches saved
+by other processes are picked up without a full reload. Saved cars are
+matched in batches by a background timer, so saving a car does no
+matching work.
+"""
+
+import atexit
+import logging
+import math
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import connection
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .models import SavedSearch, SearchAlert
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MAX_PER_USER': 20,
+    'PRICE_BUCKET_RATIO': 1.25,
+    'MAX_PRICE_BUCKETS': 8,
+    'MATCH_INTERVAL': 2.0,
+}
+
+FIELDS = ('id', 'user_id', 'marque', 'annee', 'prix_min', 'prix_max', 'carburant')
+
+EMPTY = frozenset()
+
+
+def saved_search_settings():
+    """Return SAVED_SEARCHES settings merged with defaults."""
+    return {**DEFAULTS, **getattr(settings, 'SAVED_SEARCHES', {})}
+
+
+def normalize_marque(marque):
+    return marque.strip().lower()
+
+
+def substrings(text):
+    """Every distinct substring: the terms a ``marque__icontains`` search can use."""
+    return {text[start:stop] for start in range(len(text)) for stop in range(start + 1, len(text) + 1)}
+
+
+class SavedSearchIndex:
+    """Inverted index of the active saved searches."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.built = False
+
+    # Building
+
+    def build(self):
+        """Load every active saved search."""
+        config = saved_search_settings()
+        state = self._state()
+        rows = SavedSearch.objects.filter(active=True).values_list(*FIELDS)
+        with self._lock:
+            self.log_ratio = math.log(config['PRICE_BUCKET_RATIO'])
+            self.max_price_buckets = config['MAX_PRICE_BUCKETS']
+            self.searches = {}
+            self.by_marque = defaultdict(set)
+            self.any_marque = set()
+            self.by_carburant = defaultdict(set)
+            self.any_carburant = set()
+            self.by_price = defaultdict(set)
+            self.any_price = set()
+            for row in rows.iterator():
+                self._add(row)
+            self.state = state
+            self.built = True
+
+    def _state(self):
+        return SavedSearch.objects.aggregate(
+            updated_at=Max('updated_at'), count=Count('id', filter=Q(active=True))
+        )
+
+    def sync(self):
+        """
+        Catch up with searches saved since the last sync. Deletions leave no
+        updated_at trace; they show up as a count mismatch and force a rebuild.
+        """
+        with self._lock:
+            if not self.built:
+                self.build()
+                return
+            state = self._state()
+            if state == self.state:
+                return
+            changed = SavedSearch.objects.all()
+            if self.state['updated_at'] is not None:
+                changed = changed.filter(updated_at__gte=self.state['updated_at'])
+            for row in changed.values_list(*FIELDS, 'active'):
+                self._discard(row[0])
+                if row[-1]:
+                    self._add(row[:-1])
+            if len(self.searches) != state['count']:
+                self.build()
+                return
+            self.state = state
+
+    # Index maintenance
+
+    def _price_bucket(self, prix):
+        return math.floor(math.log(max(float(prix), 1.0)) / self.log_ratio)
+
+    def _price_buckets(self, prix_min, prix_max):
+        """Buckets covered by a bounded price range; None when it is too wide to help."""
+        if prix_min is None or prix_max is None:
+            return None
+        low, high = self._price_bucket(prix_min), self._price_bucket(prix_max)
+        if high - low >= self.max_price_buckets:
+            return None
+        return range(low, high + 1)
+
+    def _keys(self, search):
+        _, _, marque, _, prix_min, prix_max, carburant = search
+        return (
+            (self.by_marque[marque] if marque else self.any_marque),
+            (self.by_carburant[carburant] if carburant else self.any_carburant),
+            [self.by_price[bucket] for bucket in self._price_buckets(prix_min, prix_max) or ()]
+            or [self.any_price],
+        )
+
+    def _add(self, row):
+        search_id, user_id, marque, annee, prix_min, prix_max, carburant = row
+        search = (
+            search_id, user_id, normalize_marque(marque), annee,
+            None if prix_min is None else float(prix_min),
+            None if prix_max is None else float(prix_max),
+            carburant,
+        )
+        self.searches[search_id] = search
+        marque_set, carburant_set, price_sets = self._keys(search)
+        marque_set.add(search_id)
+        carburant_set.add(search_id)
+        for price_set in price_sets:
+            price_set.add(search_id)
+
+    def _discard(self, search_id):
+        search = self.searches.pop(search_id, None)
+        if search is None:
+            return
+        marque_set, carburant_set, price_sets = self._keys(search)
+        marque_set.discard(search_id)
+        carburant_set.discard(search_id)
+        for price_set in price_sets:
+            price_set.discard(search_id)
+
+    # Matching
+
+    def _candidates(self, marque, carburant, prix):
+        """Return the sets of the most selective dimension for this car."""
+        dimensions = (
+            [self.by_marque[term] for term in substrings(marque) if term in self.by_marque]
+            + [self.any_marque],
+            [self.by_carburant.get(carburant, EMPTY), self.any_carburant],
+            [self.by_price.get(self._price_bucket(prix), EMPTY), self.any_price],
+        )
+        return min(dimensions, key=lambda sets: sum(map(len, sets)))
+
+    def match(self, car):
+        """Return ``(search_id, user_id)`` for every active search matching ``car``."""
+        marque = normalize_marque(car.marque)
+        prix = float(car.prix)
+        with self._lock:
+            matches = []
+            for candidates in self._candidates(marque, car.carburant, prix):
+                for search_id in candidates:
+                    _, user_id, term, annee, prix_min, prix_max, carburant = self.searches[search_id]
+                    if (
+                        term in marque
+                        and (annee is None or annee == car.annee)
+                        and (prix_min is None or prix >= prix_min)
+                        and (prix_max is None or prix <= prix_max)
+                        and (not carburant or carburant == car.carburant)
+                    ):
+                        matches.append((search_id, user_id))
+            return matches
+
+
+saved_searches = SavedSearchIndex()
+
+
+def queue_alerts(cars):
+    """Queue an alert for each saved search matched by an available car."""
+    saved_searches.sync()
+    alerts = [
+        SearchAlert(search_id=search_id, user_id=user_id, car_id=car.pk)
+        for car in cars if car.disponibilite
+        for search_id, user_id in saved_searches.match(car)
+    ]
+    # A car repriced within a range it already matched keeps its first alert.
+    SearchAlert.objects.bulk_create(alerts, batch_size=500, ignore_conflicts=True)
+    return len(alerts)
+
+
+class AlertQueue:
+    """
+    Cars waiting to be matched against the saved searches, by a timer
+    thread MATCH_INTERVAL seconds after the first one. A car saved again
+    meanwhile is matched once, with its latest values.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.flush)
+
+    def add(self, cars):
+        with self._lock:
+            for car in cars:
+                self._pending[car.pk] = car
+            if self._timer is None:
+                self._timer = threading.Timer(saved_search_settings()['MATCH_INTERVAL'], self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if pending:
+            return queue_alerts(pending.values())
+        return 0
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Saved search matching failed')
+        finally:
+            # The timer thread owns its own database connection.
+            connection.close()
+
+
+alert_queue = AlertQueue()
+
+
+def send_alert_emails():
+    """
+    Mail each user the cars queued for them since the last run and mark
+    those alerts as notified. Returns ``(users, alerts)``.
+    """
+    pending = list(
+        SearchAlert.objects.filter(notified_at__isnull=True)
+        .select_related('user', 'car', 'search').order_by('user_id', 'created_at')
+    )
+    by_user = defaultdict(list)
+    for alert in pending:
+        by_user[alert.user].append(alert)
+
+    notified = 0
+    for user, alerts in by_user.items():
+        if user.email:
+            lines = [
+                f"- {alert.car} : {alert.car.prix} €" + (f" ({alert.search.nom})" if alert.search.nom else '')
+                for alert in alerts
+            ]
+            send_mail(
+                'Star Auto - Nouvelles voitures pour vos recherches',
+                'Bonjour,\n\nCes voitures correspondent à vos recherches enregistrées :\n\n'
+                + '\n'.join(lines),
+                None,
+                [user.email],
+            )
+        # Marked per user so a failure midway does not mail earlier users twice.
+        SearchAlert.objects.filter(pk__in=[alert.pk for alert in alerts]).update(notified_at=timezone.now())
+        notified += len(alerts)
+    return len(by_user), notified
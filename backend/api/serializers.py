@@ -5,18 +5,91 @@ Star Auto - Django REST Framework Serializers
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
-from .models import Car, Message
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from .models import (
+    Car, CarHistory, Message, PriceStatistic, SavedSearch, SearchAlert, ArchivedCar, ArchivedMessage,
+    AuditEntry, UploadSession
+)
 
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
+def parse_field_list(value):
+    """Parse a comma-separated ?fields= or ?expand= value (None when absent)."""
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Lets callers keep only some fields (``fields=``) and embed related
+    objects instead of their ids (``expand=``). Expandable relations are
+    declared in ``Meta.expandable_fields`` as
+    ``{name: (serializer class or its name in this module, kwargs)}``.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+        
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name in expand or ():
+            if name in expandable and name in self.fields:
+                serializer_class, options = expandable[name]
+                if isinstance(serializer_class, str):
+                    serializer_class = globals()[serializer_class]
+                self.fields[name] = serializer_class(read_only=True, **options)
+        
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+def sparse_queryset(queryset, serializer_class, fields=None, expand=None):
+    """
+    Load only the columns behind the requested fields, join expanded
+    foreign keys and prefetch many-to-many fields that will be rendered.
+    """
+    model = queryset.model
+    columns = {model._meta.pk.name}
+    select, prefetch = [], []
+    for name in serializer_class.Meta.fields:
+        if fields is not None and name not in fields:
+            continue
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if field.many_to_many or field.one_to_many:
+            if expand and name in expand:
+                prefetch.append(name)
+            else:
+                # Rendered as primary keys: no need to load the related rows.
+                prefetch.append(Prefetch(name, queryset=field.related_model.objects.only('pk')))
+        elif field.concrete:
+            columns.add(name)
+            if field.is_relation and expand and name in expand:
+                select.append(name)
+    if fields is not None:
+        queryset = queryset.only(*columns)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for User model."""
     
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'nom', 'telephone', 'address', 'role', 'favorites']
         read_only_fields = ['id', 'role', 'favorites']
+        expandable_fields = {'favorites': ('CarListSerializer', {'many': True})}
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -46,7 +119,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return user
 
 
-class CarSerializer(serializers.ModelSerializer):
+class CarSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for Car model."""
     
     class Meta:
@@ -54,12 +127,12 @@ class CarSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'marque', 'modele', 'annee', 'prix', 'images', 'description',
             'kilometrage', 'carburant', 'transmission', 'couleur', 'disponibilite',
-            'created_at', 'updated_at'
+            'vues', 'nb_favoris', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'vues', 'nb_favoris', 'created_at', 'updated_at']
 
 
-class CarListSerializer(serializers.ModelSerializer):
+class CarListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for Car list view (lighter)."""
     
     class Meta:
@@ -70,7 +143,7 @@ class CarListSerializer(serializers.ModelSerializer):
         ]
 
 
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for Message model."""
     
     class Meta:
@@ -80,6 +153,117 @@ class MessageSerializer(serializers.ModelSerializer):
             'voiture', 'lu', 'created_at'
         ]
         read_only_fields = ['id', 'lu', 'created_at']
+        expandable_fields = {'voiture': ('CarListSerializer', {})}
+
+
+class PriceStatisticSerializer(serializers.ModelSerializer):
+    """Serializer for materialized price statistics."""
+    
+    class Meta:
+        model = PriceStatistic
+        fields = [
+            'level', 'marque', 'modele', 'annee', 'count', 'mean', 'median',
+            'p10', 'p25', 'p75', 'p90', 'km_slope', 'depreciation', 'outliers',
+            'refreshed_at'
+        ]
+
+
+class SavedSearchSerializer(serializers.ModelSerializer):
+    """Serializer for SavedSearch model."""
+    
+    CRITERIA = ('marque', 'annee', 'prix_min', 'prix_max', 'carburant')
+    
+    class Meta:
+        model = SavedSearch
+        fields = [
+            'id', 'nom', 'marque', 'annee', 'prix_min', 'prix_max', 'carburant',
+            'active', 'created_at'
+        ]
+        read_only_fields = ['id', 'created_at']
+    
+    def validate(self, attrs):
+        criteria = {field: getattr(self.instance, field, None) for field in self.CRITERIA}
+        criteria.update((field, attrs[field]) for field in self.CRITERIA if field in attrs)
+        if all(value in (None, '') for value in criteria.values()):
+            raise serializers.ValidationError("Indiquez au moins un critère de recherche.")
+        prix_min, prix_max = criteria.get('prix_min'), criteria.get('prix_max')
+        if prix_min is not None and prix_max is not None and prix_min > prix_max:
+            raise serializers.ValidationError({"prix_max": "Le prix maximum doit être supérieur au prix minimum."})
+        return attrs
+
+
+class SearchAlertSerializer(serializers.ModelSerializer):
+    """Serializer for SearchAlert model."""
+    
+    car = CarListSerializer(read_only=True)
+    
+    class Meta:
+        model = SearchAlert
+        fields = ['id', 'search', 'car', 'lu', 'created_at']
+
+
+class PriceHistorySerializer(serializers.Serializer):
+    """Serializer for one state of a car's price timeline."""
+    
+    date = serializers.DateTimeField()
+    prix = serializers.DecimalField(max_digits=10, decimal_places=2)
+    disponibilite = serializers.BooleanField()
+
+
+class PriceDropSerializer(serializers.ModelSerializer):
+    """Serializer for a CarHistory price drop."""
+    
+    car = CarListSerializer(read_only=True)
+    
+    class Meta:
+        model = CarHistory
+        fields = ['car', 'ancien_prix', 'prix', 'changed_at']
+
+
+class ArchivedCarSerializer(serializers.ModelSerializer):
+    """Serializer for ArchivedCar model."""
+    
+    class Meta:
+        model = ArchivedCar
+        fields = '__all__'
+
+
+class ArchivedMessageSerializer(serializers.ModelSerializer):
+    """Serializer for ArchivedMessage model."""
+    
+    class Meta:
+        model = ArchivedMessage
+        fields = '__all__'
+
+
+class AuditEntrySerializer(serializers.ModelSerializer):
+    """Serializer for AuditEntry model."""
+    
+    actor_email = serializers.EmailField(source='actor.email', read_only=True, default=None)
+    
+    class Meta:
+        model = AuditEntry
+        fields = ['id', 'actor', 'actor_email', 'action', 'model', 'object_id', 'changes', 'created_at']
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Serializer for UploadSession model; ``url`` is set once the upload is complete."""
+    
+    sha256 = serializers.CharField(source='image_id', read_only=True)
+    complete = serializers.BooleanField(read_only=True)
+    url = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'size', 'offset', 'car', 'complete', 'sha256', 'url', 'created_at']
+        read_only_fields = ['offset']
+    
+    def get_url(self, obj):
+        if obj.image is None:
+            return None
+        from .uploads import image_url
+        
+        return image_url(self.context['request'], obj.image)
 
 
 class PasswordChangeSerializer(serializers.Serializer):
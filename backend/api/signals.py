@@ -0,0 +1,194 @@
+"""
+Star Auto - Model Signal Handlers
+"""
+
+import sys
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_save, post_delete, post_migrate, m2m_changed
+from django.dispatch import receiver, Signal
+
+from .models import Car, CarDeletion, Message, User
+
+# The subsystems the handlers feed are imported on first use, not when
+# ready() connects the handlers, to keep them off cold starts.
+
+
+# Sent after QuerySet.update() on cars (which sends no post_save), with
+# ``pks``, the updated ``fields`` and optionally the ``previous`` price and
+# availability of the cars (from history.tracked_values).
+cars_bulk_updated = Signal()
+
+
+def loaded_similar_cars():
+    """
+    Return the similar-car index if this process has imported it. The module
+    pulls in NumPy, so only the similar endpoint imports it; an index that
+    was never loaded has nothing to keep in sync.
+    """
+    module = sys.modules.get('api.recommendations')
+    return module.similar_cars if module else None
+
+
+def loaded_catalogue_index():
+    """Return the columnar catalogue index if this process has imported it (NumPy, opt-in)."""
+    module = sys.modules.get('api.catalogue_index')
+    return module.catalogue_index if module else None
+
+
+def loaded_autocomplete():
+    """Return the autocomplete index if this process has imported it; it is built on first use."""
+    module = sys.modules.get('api.autocomplete')
+    return module.autocomplete if module else None
+
+
+@receiver(post_save, sender=Car)
+def car_saved(sender, instance, created, **kwargs):
+    """
+    Keep indexes, snapshots and image references in sync with saved cars,
+    publish and record changes and alert saved searches matching new,
+    repriced or relisted cars.
+    """
+    from . import events
+    from .history import record_changes
+    from .searches import alert_queue
+    from .snapshots import schedule_rebuild
+    from .uploads import update_references
+    
+    index = loaded_similar_cars()
+    if index is not None:
+        index.update_car(instance)
+    catalogue = loaded_catalogue_index()
+    if catalogue is not None:
+        catalogue.update_cars([instance])
+    autocomplete = loaded_autocomplete()
+    if autocomplete is not None:
+        autocomplete.car_saved(instance, created)
+    if created:
+        update_references([], instance.images)
+    else:
+        image_changes = instance.tracked_changes('images')
+        if image_changes:
+            update_references(*image_changes['images'])
+    schedule_rebuild()
+    if created:
+        events.publish(events.INVENTORY, 'car.created', events.car_event_data(instance))
+        transaction.on_commit(lambda: alert_queue.add([instance]))
+        return
+    changes = instance.tracked_changes('prix', 'disponibilite')
+    if changes:
+        record_changes(instance, changes)
+        transaction.on_commit(lambda: alert_queue.add([instance]))
+        events.publish(events.INVENTORY, 'car.updated', {
+            **events.car_event_data(instance),
+            'changes': {name: [str(old), str(new)] for name, (old, new) in changes.items()},
+        })
+
+
+@receiver(cars_bulk_updated, sender=Car)
+def cars_updated_in_bulk(sender, pks, fields, previous=None, **kwargs):
+    """Propagate bulk updates to the history, indexes, snapshots, live events and saved searches."""
+    from . import events
+    from .history import record_bulk_changes
+    from .searches import alert_queue
+    from .snapshots import schedule_rebuild
+    
+    if previous:
+        record_bulk_changes(previous)
+    index = loaded_similar_cars()
+    catalogue = loaded_catalogue_index()
+    schedule_rebuild()
+    published = [field for field in fields if field in ('prix', 'disponibilite')]
+    if index is None and catalogue is None and not published:
+        return
+    cars = list(Car.objects.filter(pk__in=pks))
+    if catalogue is not None:
+        catalogue.update_cars(cars)
+    for car in cars:
+        if index is not None:
+            index.update_car(car)
+        if published:
+            events.publish(events.INVENTORY, 'car.updated', {
+                **events.car_event_data(car),
+                'changes': {field: [None, str(getattr(car, field))] for field in published},
+            })
+    if published:
+        transaction.on_commit(lambda: alert_queue.add(cars))
+
+
+@receiver(post_delete, sender=Car)
+def car_deleted(sender, instance, **kwargs):
+    """Record a tombstone, release the car's images and drop it from indexes and snapshots."""
+    from . import events
+    from .snapshots import schedule_rebuild
+    from .uploads import update_references
+    
+    CarDeletion.objects.create(car_id=instance.pk)
+    update_references(instance.images, [])
+    index = loaded_similar_cars()
+    if index is not None:
+        index.remove_car(instance.pk)
+    catalogue = loaded_catalogue_index()
+    if catalogue is not None:
+        catalogue.remove_car(instance.pk)
+    autocomplete = loaded_autocomplete()
+    if autocomplete is not None:
+        autocomplete.car_deleted(instance)
+    schedule_rebuild()
+    events.publish(events.INVENTORY, 'car.deleted', {'id': instance.pk})
+
+
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, created, **kwargs):
+    """Notify admin inboxes of new contact messages."""
+    if created:
+        from . import events
+        
+        events.publish(events.INBOX, 'message.created', events.message_event_data(instance))
+
+
+@receiver(m2m_changed, sender=User.favorites.through)
+def favorites_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Count favorite changes and refresh co-favorite signals."""
+    if action == 'pre_clear':
+        # post_clear carries no pk_set: remember what is being removed.
+        if reverse:
+            instance._cleared_favorites = [instance.pk] * instance.favorited_by.count()
+        else:
+            instance._cleared_favorites = list(instance.favorites.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    from .popularity import popularity
+    
+    delta = 1 if action == 'post_add' else -1
+    if action == 'post_clear':
+        popularity.record_favorites(instance.__dict__.pop('_cleared_favorites', []), delta)
+    elif reverse:
+        popularity.record_favorites([instance.pk] * len(pk_set), delta)
+    else:
+        popularity.record_favorites(pk_set, delta)
+    
+    index = loaded_similar_cars()
+    if index is None:
+        return
+    if not reverse:
+        index.favorites_changed(user_ids=[instance.pk])
+    elif pk_set:
+        index.favorites_changed(user_ids=pk_set)
+    else:
+        index.favorites_changed(car_id=instance.pk)
+
+
+@receiver(post_migrate)
+def backfill_popularity(sender, app_config, using, **kwargs):
+    """
+    Count the favorites that predate the nb_favoris column (or were lost):
+    removing them would otherwise be clamped at zero and never counted.
+    """
+    if app_config.name != 'api' or using != DEFAULT_DB_ALIAS:
+        return
+    if Car.objects.filter(nb_favoris=0, favorited_by__isnull=False).exists():
+        from .popularity import recount_popularity
+        
+        recount_popularity()
@@ -0,0 +1,195 @@
+"""
+Star Auto - Static Catalogue Snapshots
+
+Renders the hottest anonymous reads (default listing pages, per-brand
+listing pages and every car detail) to JSON files under STATIC_ROOT so a
+CDN or web server can serve them without Python. Files carry a content
+hash in their name and come precompressed (gzip, and brotli when the
+``brotli`` package is installed); manifest.json maps logical names such
+as ``cars/page-1`` or ``cars/42`` to the current files.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.text import slugify
+from rest_framework.renderers import JSONRenderer
+
+from .models import Car
+from .serializers import CarSerializer, CarListSerializer
+
+try:
+    import brotli
+except ImportError:  # optional: only .gz files are written without it
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'DIRECTORY': 'catalogue',
+    'AUTO_REBUILD': False,
+    'REBUILD_DELAY': 5.0,
+}
+
+MANIFEST = 'manifest.json'
+
+
+def snapshot_settings():
+    """Return CATALOGUE_SNAPSHOTS settings merged with defaults."""
+    return {**DEFAULTS, **getattr(settings, 'CATALOGUE_SNAPSHOTS', {})}
+
+
+def snapshot_root():
+    return Path(settings.STATIC_ROOT) / snapshot_settings()['DIRECTORY']
+
+
+def _write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    temporary.write_bytes(data)
+    os.replace(temporary, path)
+
+
+class SnapshotWriter:
+    """Writes content-addressed files and collects the manifest entries."""
+
+    def __init__(self, root):
+        self.root = root
+        self.renderer = JSONRenderer()
+        self.files = {}
+        self.written = 0
+
+    def add(self, name, data):
+        content = self.renderer.render(data)
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        filename = f'{name}.{digest}.json'
+        self.files[name] = filename
+        path = self.root / filename
+        if path.exists():
+            return
+        _write_atomic(path.with_name(path.name + '.gz'), gzip.compress(content, 9, mtime=0))
+        if brotli is not None:
+            _write_atomic(path.with_name(path.name + '.br'), brotli.compress(content))
+        # The plain file goes last: its presence marks the set as complete.
+        _write_atomic(path, content)
+        self.written += 1
+
+    def add_listing(self, name, cars, page_size):
+        """Write paginated listing files shaped like the API's paginated list."""
+        pages = max(1, -(-len(cars) // page_size))
+        for page in range(1, pages + 1):
+            chunk = cars[(page - 1) * page_size:page * page_size]
+            self.add(f'{name}/page-{page}', {
+                'count': len(cars),
+                'next': f'{name}/page-{page + 1}' if page < pages else None,
+                'previous': f'{name}/page-{page - 1}' if page > 1 else None,
+                'results': CarListSerializer(chunk, many=True).data,
+            })
+
+
+_build_lock = threading.Lock()
+
+
+def build_snapshots():
+    """
+    Render every snapshot and publish a new manifest. Unchanged files keep
+    their names and are not rewritten. Returns ``(files, written)``.
+    """
+    with _build_lock:
+        return _build_snapshots()
+
+
+def _build_snapshots():
+    root = snapshot_root()
+    writer = SnapshotWriter(root)
+    page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE') or 10
+
+    cars = list(Car.objects.order_by('-created_at'))
+    writer.add_listing('cars', cars, page_size)
+
+    by_marque = {}
+    for car in cars:
+        by_marque.setdefault(slugify(car.marque) or 'autre', []).append(car)
+    for slug, marque_cars in by_marque.items():
+        writer.add_listing(f'cars/marque/{slug}', marque_cars, page_size)
+
+    for car in cars:
+        writer.add(f'cars/{car.pk}', CarSerializer(car).data)
+
+    manifest_path = root / MANIFEST
+    previous = {}
+    if manifest_path.exists():
+        previous = json.loads(manifest_path.read_text(encoding='utf-8')).get('files', {})
+    manifest = {'generated_at': timezone.now().isoformat(), 'files': writer.files}
+    _write_atomic(manifest_path, json.dumps(manifest, indent=1).encode('utf-8'))
+
+    # Keep the previous generation for clients holding the old manifest.
+    keep = set(writer.files.values()) | set(previous.values())
+    for path in root.rglob('*.json*'):
+        relative = path.relative_to(root).as_posix()
+        base = relative.rsplit('.json', 1)[0] + '.json'
+        if relative != MANIFEST and not path.name.startswith('.') and base not in keep:
+            path.unlink()
+    return len(writer.files), writer.written
+
+
+def export_frontend_cars(path):
+    """Write the legacy frontend/data/cars.json shape from the database."""
+    cars = [
+        {
+            'id': str(car.pk),
+            'marque': car.marque,
+            'modele': car.modele,
+            'annee': car.annee,
+            'prix': float(car.prix),
+            'kilometrage': car.kilometrage,
+            'carburant': car.carburant,
+            'boite': car.transmission,
+            'description': car.description,
+            'image': car.images[0] if car.images else '',
+            'disponible': car.disponibilite,
+            'createdAt': car.created_at.isoformat().replace('+00:00', 'Z'),
+        }
+        for car in Car.objects.order_by('created_at')
+    ]
+    _write_atomic(Path(path), json.dumps(cars, indent=2, ensure_ascii=False).encode('utf-8'))
+    return len(cars)
+
+
+_timer = None
+_timer_lock = threading.Lock()
+
+
+def _rebuild_from_timer():
+    global _timer
+    with _timer_lock:
+        _timer = None
+    try:
+        build_snapshots()
+    except Exception:
+        # Nothing else would report it from the timer thread; the next write schedules a new try.
+        logger.exception('Snapshot rebuild failed')
+    finally:
+        connection.close()
+
+
+def schedule_rebuild():
+    """Rebuild snapshots shortly after a write, coalescing bursts of writes."""
+    global _timer
+    config = snapshot_settings()
+    if not config['AUTO_REBUILD']:
+        return
+    with _timer_lock:
+        if _timer is None:
+            _timer = threading.Timer(config['REBUILD_DELAY'], _rebuild_from_timer)
+            _timer.daemon = True
+            _timer.start()
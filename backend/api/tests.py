@@ -0,0 +1,69 @@
+"""
+Star Auto - API Tests
+"""
+
+import base64
+import json
+
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from . import ingestion
+from .changefeed import encode_cursor
+
+
+def raw_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+
+
+class ChangeFeedTests(APITestCase):
+    """GET /api/cars/changes/ answers 400, not 500, to malformed parameters."""
+    
+    url = '/api/cars/changes/'
+    
+    def test_valid_cursor(self):
+        cursor = encode_cursor(None, 0, 0, timezone.now())
+        response = self.client.get(self.url, {'cursor': cursor})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_negative_limit(self):
+        for limit in ('-1', '-2'):
+            response = self.client.get(self.url, {'limit': limit})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_tampered_cursor(self):
+        for cursor in ('not-a-cursor', raw_cursor(['x']), raw_cursor({'t': None, 'c': 'x', 'd': 0})):
+            response = self.client.get(self.url, {'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_naive_cursor(self):
+        cursors = (
+            raw_cursor({'t': None, 'c': 0, 'd': 0, 'i': '2026-01-01T00:00:00'}),
+            raw_cursor({'t': '2026-01-01T00:00:00', 'c': 0, 'd': 0, 'i': timezone.now().isoformat()}),
+        )
+        for cursor in cursors:
+            response = self.client.get(self.url, {'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(MESSAGE_INGESTION={**settings.MESSAGE_INGESTION, 'IP_BURST': 2, 'BATCH_WRITES': False})
+class MessageThrottleTests(APITestCase):
+    """The per-IP contact message limit can't be reset from the client."""
+    
+    def setUp(self):
+        ingestion._store = None
+    
+    def post_message(self, number, forwarded_for):
+        return self.client.post('/api/messages/', {
+            'nom': 'Test',
+            'email': f'sender-{number}@example.com',
+            'sujet': 'Essai',
+            'message': f'Message {number}',
+        }, format='json', HTTP_X_FORWARDED_FOR=forwarded_for)
+    
+    def test_forwarded_for_does_not_reset_bucket(self):
+        codes = [self.post_message(number, f'203.0.113.{number}').status_code for number in range(3)]
+        self.assertEqual(codes, [status.HTTP_201_CREATED, status.HTTP_201_CREATED, status.HTTP_429_TOO_MANY_REQUESTS])
@@ -0,0 +1,314 @@
+"""
+Star Auto - Resumable Image Uploads
+
+Car photos are uploaded in chunks to an upload session: each PATCH body
+is streamed to a partial file under MEDIA_ROOT in small buffers while it
+is hashed, so a worker never holds more than BUFFER_SIZE bytes of it, and
+an interrupted upload resumes from the last stored offset. A completed
+file is stored once under its SHA-256 (``images/ab/<sha256>.jpg``): the
+same photo uploaded for several listings is kept a single time, and
+StoredImage.ref_count follows the Car.images entries pointing to it.
+Images no car refers to any more are deleted by ``manage.py
+cleanupuploads`` after a grace period.
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import ArchivedCar, Car, StoredImage, UploadSession
+
+
+DEFAULTS = {
+    'MAX_SIZE': 25 * 1024 * 1024,
+    'MAX_CHUNK_SIZE': 8 * 1024 * 1024,
+    'BUFFER_SIZE': 64 * 1024,
+    'WRITE_LEASE_SECONDS': 600,
+    'SESSION_TTL_HOURS': 24,
+    'ORPHAN_GRACE_DAYS': 7,
+}
+
+# Leading bytes of the accepted formats.
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+STORED_IMAGE_URL = re.compile(r'/images/[0-9a-f]{2}/([0-9a-f]{64})\.\w+$')
+
+# Hash states of the uploads in progress in this process.
+MAX_HASHERS = 256
+
+
+class UploadError(ValueError):
+    """The chunk or the upload is rejected; ``status`` is the HTTP status to answer."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def upload_settings():
+    """Return IMAGE_UPLOADS settings merged with defaults."""
+    return {**DEFAULTS, **getattr(settings, 'IMAGE_UPLOADS', {})}
+
+
+def media_path(name):
+    return Path(settings.MEDIA_ROOT, name)
+
+
+def partial_path(session):
+    return media_path(f'uploads/{session.pk}.part')
+
+
+def image_url(request, image):
+    return request.build_absolute_uri(f'/{settings.MEDIA_URL.strip("/")}/{image.name}')
+
+
+def image_digest(url):
+    """SHA-256 of a stored image URL, None for other (external) URLs."""
+    match = STORED_IMAGE_URL.search(url) if isinstance(url, str) else None
+    return match.group(1) if match else None
+
+
+def detect_extension(path):
+    with open(path, 'rb') as file:
+        head = file.read(16)
+    for signature, extension in SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+class HasherCache:
+    """
+    SHA-256 states of the partial files, keyed by session. A session
+    resumed in another process, or after an eviction, is rehashed from
+    its partial file.
+    """
+
+    def __init__(self):
+        self._hashers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, session, path):
+        with self._lock:
+            offset, hasher = self._hashers.pop(session.pk, (None, None))
+        if offset == session.offset:
+            return hasher
+        hasher = hashlib.sha256()
+        buffer_size = upload_settings()['BUFFER_SIZE']
+        remaining = session.offset
+        with open(path, 'rb') as file:
+            while remaining:
+                data = file.read(min(buffer_size, remaining))
+                if not data:
+                    raise UploadError('Fichier partiel incomplet, recommencez l\'envoi.', 409)
+                hasher.update(data)
+                remaining -= len(data)
+        return hasher
+
+    def put(self, session, hasher):
+        with self._lock:
+            self._hashers[session.pk] = (session.offset, hasher)
+            while len(self._hashers) > MAX_HASHERS:
+                self._hashers.popitem(last=False)
+
+    def discard(self, session):
+        with self._lock:
+            self._hashers.pop(session.pk, None)
+
+
+hashers = HasherCache()
+
+
+def start_upload(user, size, filename='', car=None):
+    """Open an upload session for a file of ``size`` bytes."""
+    if size <= 0 or size > upload_settings()['MAX_SIZE']:
+        raise UploadError(f"La taille doit être comprise entre 1 et {upload_settings()['MAX_SIZE']} octets.")
+    session = UploadSession.objects.create(user=user, size=size, filename=filename[:255], car=car)
+    path = partial_path(session)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    return session
+
+
+def write_chunk(session, stream, offset, length):
+    """
+    Append ``length`` bytes read from ``stream`` at ``offset``, which must
+    be the session's current offset. Bytes received before a disconnect
+    are kept, so the client resumes from the returned session's offset.
+    The session is leased to this request (a conditional UPDATE, which
+    every database serializes) before the partial file is touched, so a
+    concurrent PATCH of the same session is refused instead of writing
+    into the same file.
+    """
+    config = upload_settings()
+    if session.complete:
+        raise UploadError('Cet envoi est déjà terminé.', 409)
+    if offset != session.offset:
+        raise UploadError('Décalage incorrect.', 409)
+    if length > config['MAX_CHUNK_SIZE'] or offset + length > session.size:
+        raise UploadError('Morceau trop grand.', 413)
+
+    now = timezone.now()
+    lease = now + timedelta(seconds=config['WRITE_LEASE_SECONDS'])
+    claimed = UploadSession.objects.filter(pk=session.pk, offset=offset).filter(
+        Q(writing_until__isnull=True) | Q(writing_until__lt=now)
+    ).update(writing_until=lease)
+    if not claimed:
+        raise UploadError('Décalage incorrect ou morceau déjà en cours d\'envoi.', 409)
+    try:
+        path = partial_path(session)
+        if not path.exists():
+            raise UploadError('Envoi expiré, recommencez.', 410)
+        hasher = hashers.take(session, path)
+        received = 0
+        with open(path, 'r+b') as file:
+            # Drop bytes written past the offset by a request that failed midway.
+            file.truncate(offset)
+            file.seek(offset)
+            try:
+                while received < length:
+                    data = stream.read(min(config['BUFFER_SIZE'], length - received))
+                    if not data:
+                        break
+                    file.write(data)
+                    hasher.update(data)
+                    received += len(data)
+            except OSError:
+                # Client disconnected: keep what arrived, the client resumes from there.
+                pass
+
+        # Only while the lease is still ours: an expired one may have been taken over.
+        updated = UploadSession.objects.filter(pk=session.pk, offset=offset, writing_until=lease).update(
+            offset=offset + received, updated_at=timezone.now()
+        )
+        if not updated:
+            hashers.discard(session)
+            raise UploadError('Décalage incorrect.', 409)
+        session.offset = offset + received
+        if session.offset < session.size:
+            hashers.put(session, hasher)
+            return session
+        return finish_upload(session, path, hasher.hexdigest())
+    finally:
+        UploadSession.objects.filter(pk=session.pk, writing_until=lease).update(writing_until=None)
+
+
+def finish_upload(session, path, digest):
+    """
+    Store the complete file under its digest, or drop it if that image is
+    already stored. A new image counts as orphaned until a car refers to it.
+    """
+    hashers.discard(session)
+    extension = detect_extension(path)
+    if extension is None:
+        path.unlink(missing_ok=True)
+        session.delete()
+        raise UploadError('Format d\'image non pris en charge (JPEG, PNG, GIF ou WebP).', 415)
+
+    with transaction.atomic():
+        image, created = StoredImage.objects.get_or_create(
+            sha256=digest,
+            defaults={'extension': extension, 'size': session.size, 'orphaned_at': timezone.now()},
+        )
+        if not created and image.ref_count <= 0:
+            # Restart the grace period of an unreferenced image uploaded again.
+            StoredImage.objects.filter(pk=image.pk).update(orphaned_at=timezone.now())
+        target = media_path(image.name)
+        if target.exists():
+            path.unlink()
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(path, target)
+        session.image = image
+        session.save(update_fields=['image', 'offset', 'updated_at'])
+    return session
+
+
+def attach_to_car(session, url):
+    """
+    Append the uploaded image to the session's car (the save counts the
+    reference). Returns the car and its previous images.
+    """
+    with transaction.atomic():
+        car = Car.objects.select_for_update().get(pk=session.car_id)
+        previous = list(car.images)
+        if url not in car.images:
+            car.images = car.images + [url]
+            car.save()
+    return car, previous
+
+
+def abort_upload(session):
+    hashers.discard(session)
+    partial_path(session).unlink(missing_ok=True)
+    session.delete()
+
+
+def update_references(old_images, new_images):
+    """Adjust StoredImage.ref_count for the stored images added to or removed from a car."""
+    delta = Counter(filter(None, map(image_digest, new_images or [])))
+    delta.subtract(Counter(filter(None, map(image_digest, old_images or []))))
+    by_delta = {}
+    for digest, change in delta.items():
+        if change:
+            by_delta.setdefault(change, []).append(digest)
+    for change, digests in by_delta.items():
+        StoredImage.objects.filter(sha256__in=digests).update(ref_count=F('ref_count') + change)
+    changed = [digest for digests in by_delta.values() for digest in digests]
+    if changed:
+        StoredImage.objects.filter(sha256__in=changed, ref_count__gt=0).update(orphaned_at=None)
+        StoredImage.objects.filter(
+            sha256__in=changed, ref_count__lte=0, orphaned_at__isnull=True
+        ).update(orphaned_at=timezone.now())
+
+
+def cleanup(dry_run=False):
+    """
+    Delete upload sessions older than SESSION_TTL_HOURS with their partial
+    files, and images unreferenced for ORPHAN_GRACE_DAYS that no car, live
+    or archived, shows. Returns ``{'sessions': n, 'images': n}``.
+    """
+    config = upload_settings()
+    now = timezone.now()
+    sessions = UploadSession.objects.filter(updated_at__lt=now - timedelta(hours=config['SESSION_TTL_HOURS']))
+    orphaned = Q(ref_count__lte=0, orphaned_at__lt=now - timedelta(days=config['ORPHAN_GRACE_DAYS']))
+    orphans = StoredImage.objects.filter(orphaned)
+    # Archived cars hold no references; live cars are checked as well in case a count drifted.
+    referenced = {
+        digest
+        for model in (Car, ArchivedCar)
+        for images in model.objects.values_list('images', flat=True).iterator()
+        for digest in map(image_digest, images or []) if digest
+    }
+    orphans = [image for image in orphans if image.sha256 not in referenced]
+    counts = {'sessions': sessions.count(), 'images': len(orphans)}
+    if dry_run:
+        return counts
+
+    for session in sessions:
+        abort_upload(session)
+    counts['images'] = 0
+    for image in orphans:
+        # Checked again when deleting: the image may have been attached or uploaded again since.
+        with transaction.atomic():
+            deleted, _ = StoredImage.objects.filter(orphaned, pk=image.pk).delete()
+            if deleted:
+                media_path(image.name).unlink(missing_ok=True)
+                counts['images'] += 1
+    return counts
@@ -11,6 +11,11 @@ from . import views
 router = DefaultRouter()
 router.register(r'cars', views.CarViewSet, basename='car')
 router.register(r'messages', views.MessageViewSet, basename='message')
+router.register(r'searches', views.SavedSearchViewSet, basename='saved_search')
+router.register(r'admin/archive/cars', views.ArchivedCarViewSet, basename='archived_car')
+router.register(r'admin/archive/messages', views.ArchivedMessageViewSet, basename='archived_message')
+router.register(r'admin/audit', views.AuditEntryViewSet, basename='audit_entry')
+router.register(r'uploads', views.UploadViewSet, basename='upload')
 
 urlpatterns = [
     # Router URLs
@@ -29,8 +34,21 @@ urlpatterns = [
     path('favorites/<int:car_id>/', views.favorites, name='favorite_detail'),
     path('favorites/check/<int:car_id>/', views.check_favorite, name='check_favorite'),
     
+    # Batch requests
+    path('batch/', views.batch, name='batch'),
+    
+    # Live events
+    path('events/ticket/', views.events_ticket, name='events_ticket'),
+    path('events/stream/', views.events_stream, name='events_stream'),
+    path('events/poll/', views.events_poll, name='events_poll'),
+    
     # Admin
     path('admin/stats/', views.admin_stats, name='admin_stats'),
     path('admin/users/', views.admin_users, name='admin_users'),
     path('admin/users/<int:user_id>/', views.admin_user, name='admin_user'),
+    path('admin/analytics/prices/', views.admin_price_stats, name='admin_price_stats'),
+    path('admin/analytics/outliers/', views.admin_price_outliers, name='admin_price_outliers'),
+    path('admin/analytics/refresh/', views.admin_price_refresh, name='admin_price_refresh'),
+    path('admin/profiles/', views.admin_profiles, name='admin_profiles'),
+    path('admin/profiles/<slug:profile_id>/', views.admin_profile, name='admin_profile'),
 ]
@@ -2,33 +2,107 @@
 Star Auto - Django REST Framework Views
 """
 
+import json
+import time
+
 from rest_framework import viewsets, status, generics
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny
+from rest_framework.permissions import BasePermission, IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.pagination import CursorPagination
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db.models import Q, Count
 from django.shortcuts import get_object_or_404
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 
-from .models import Car, Message
+from .models import (
+    Car, Message, PriceStatistic, SavedSearch, SearchAlert, ArchivedCar, ArchivedMessage, AuditEntry,
+    UploadSession
+)
 from .serializers import (
     CarSerializer, CarListSerializer, MessageSerializer,
-    UserSerializer, UserRegistrationSerializer, PasswordChangeSerializer
+    UserSerializer, UserRegistrationSerializer, PasswordChangeSerializer,
+    PriceStatisticSerializer, PriceHistorySerializer, PriceDropSerializer,
+    SavedSearchSerializer, SearchAlertSerializer,
+    ArchivedCarSerializer, ArchivedMessageSerializer, AuditEntrySerializer,
+    UploadSessionSerializer,
+    parse_field_list, sparse_queryset
 )
+from .popularity import popularity
+from .profiling import get_store
+from . import audit
+
+# The other subsystems (ingestion, uploads, events, change feed...) are
+# imported by the views using them, to keep them off cold starts.
 
 User = get_user_model()
 
 
-class IsAdminUser:
+class IsAdminUser(BasePermission):
     """Permission class to check if user is admin."""
     
     def has_permission(self, request, view):
         return request.user and request.user.is_authenticated and request.user.role == 'ADMIN'
 
 
-class CarViewSet(viewsets.ModelViewSet):
+def sparse_params(request):
+    """Return the ``(fields, expand)`` sets requested on a GET, else ``(None, None)``."""
+    if request.method != 'GET':
+        return None, None
+    return (
+        parse_field_list(request.query_params.get('fields')),
+        parse_field_list(request.query_params.get('expand')),
+    )
+
+
+class SparseFieldsViewMixin:
+    """
+    Honours ``?fields=`` and ``?expand=`` on reads: the serializer drops or
+    embeds fields and the queryset loads only the matching columns.
+    """
+    
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = sparse_params(self.request)
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        if expand:
+            kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+    
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fields, expand = sparse_params(self.request)
+        if fields is None and not expand:
+            return queryset
+        return sparse_queryset(queryset, self.get_serializer_class(), fields, expand)
+
+
+class AuditMixin:
+    """Records the creations, updates and deletions made through the viewset."""
+    
+    def perform_create(self, serializer):
+        instance = serializer.save()
+        audit.record(self.request.user, audit.CREATE, instance, after=audit.snapshot(instance))
+    
+    def perform_update(self, serializer):
+        before = audit.snapshot(serializer.instance)
+        instance = serializer.save()
+        audit.record(self.request.user, audit.UPDATE, instance, before, audit.snapshot(instance))
+    
+    def perform_destroy(self, instance):
+        before, pk = audit.snapshot(instance), instance.pk
+        instance.delete()
+        audit.record(self.request.user, audit.DELETE, instance, before, object_id=pk)
+
+
+class CarViewSet(AuditMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     ViewSet for Car CRUD operations.
     """
@@ -78,11 +152,35 @@ class CarViewSet(viewsets.ModelViewSet):
             queryset = queryset.order_by('-annee')
         elif sort == 'year-asc':
             queryset = queryset.order_by('annee')
+        elif sort == 'popular':
+            queryset = queryset.order_by('-popularite', '-created_at')
         else:
             queryset = queryset.order_by('-created_at')
         
         return queryset
     
+    def list(self, request, *args, **kwargs):
+        if not getattr(settings, 'CATALOGUE_INDEX', {}).get('ENABLED'):
+            return super().list(request, *args, **kwargs)
+        
+        from .catalogue_index import catalogue_index  # NumPy: only when enabled
+        
+        ids = catalogue_index.search(request.query_params)
+        if ids is None:
+            return super().list(request, *args, **kwargs)
+        page = self.paginate_queryset(ids)
+        ids = [int(car_id) for car_id in (ids if page is None else page)]
+        cars = {car.pk: car for car in self.filter_queryset(Car.objects.filter(pk__in=ids))}
+        serializer = self.get_serializer([cars[car_id] for car_id in ids if car_id in cars], many=True)
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+    
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        popularity.record_view(int(kwargs['pk']))
+        return response
+    
     def create(self, request, *args, **kwargs):
         if not request.user.is_authenticated or request.user.role != 'ADMIN':
             return Response(
@@ -106,9 +204,97 @@ class CarViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         return super().destroy(request, *args, **kwargs)
+    
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """Get cars changed or deleted since the given cursor."""
+        from .changefeed import get_changes, InvalidCursor, ExpiredCursor
+        
+        try:
+            limit = int(request.query_params.get('limit', 0)) or None
+            cars, deleted, cursor, has_more = get_changes(request.query_params.get('cursor'), limit)
+        except (ValueError, InvalidCursor):
+            return Response(
+                {'success': False, 'message': 'Curseur ou limite invalide.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except ExpiredCursor:
+            return Response(
+                {'success': False, 'message': 'Curseur expiré, une synchronisation complète est requise.'},
+                status=status.HTTP_410_GONE
+            )
+        return Response({
+            'success': True,
+            'changed': CarSerializer(cars, many=True).data,
+            'deleted': deleted,
+            'cursor': cursor,
+            'hasMore': has_more
+        })
+    
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """Suggest brands and models for a typed prefix, from memory."""
+        from .autocomplete import autocomplete, autocomplete_settings
+        
+        config = autocomplete_settings()
+        try:
+            limit = min(max(int(request.query_params.get('limit', config['LIMIT'])), 1), config['MAX_LIMIT'])
+        except ValueError:
+            limit = config['LIMIT']
+        return Response({
+            'success': True,
+            'suggestions': autocomplete.suggest(request.query_params.get('q', ''), limit)
+        })
+    
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """Get the car's price and availability timeline."""
+        from .history import price_timeline
+        
+        car = self.get_object()
+        serializer = PriceHistorySerializer(price_timeline(car), many=True)
+        return Response({
+            'success': True,
+            'history': serializer.data
+        })
+    
+    @action(detail=False, methods=['get'], url_path='price-drops')
+    def price_drops(self, request):
+        """Get available cars whose price dropped recently, latest first."""
+        from .history import recent_price_drops
+        
+        try:
+            days = min(max(int(request.query_params.get('days', 7)), 1), 365)
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        except ValueError:
+            return Response(
+                {'success': False, 'message': 'Paramètres invalides.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = PriceDropSerializer(recent_price_drops(days, limit), many=True)
+        return Response({
+            'success': True,
+            'count': len(serializer.data),
+            'drops': serializer.data
+        })
+    
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Get cars similar to this one."""
+        from .recommendations import similar_cars  # NumPy: keep it off cold starts
+        
+        car = self.get_object()
+        ids = similar_cars.similar(car)
+        cars = Car.objects.in_bulk(ids)
+        serializer = CarListSerializer([cars[i] for i in ids if i in cars], many=True)
+        return Response({
+            'success': True,
+            'count': len(serializer.data),
+            'similar': serializer.data
+        })
 
 
-class MessageViewSet(viewsets.ModelViewSet):
+class MessageViewSet(AuditMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     ViewSet for Message CRUD operations.
     """
@@ -125,10 +311,36 @@ class MessageViewSet(viewsets.ModelViewSet):
             return Message.objects.all().order_by('-created_at')
         return Message.objects.none()
     
+    def get_throttles(self):
+        if self.action == 'create':
+            from .ingestion import MessageIPThrottle, MessageEmailThrottle
+            
+            return [MessageIPThrottle(), MessageEmailThrottle()]
+        return super().get_throttles()
+    
     def create(self, request, *args, **kwargs):
+        from .ingestion import claim_message, ingestion_settings, message_buffer, release_message
+        
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        if not claim_message(serializer.validated_data):
+            # Same message resent within the dedup window: acknowledge, don't write
+            return Response(
+                {'success': True, 'duplicate': True, 'data': serializer.data},
+                status=status.HTTP_200_OK
+            )
+        if ingestion_settings()['BATCH_WRITES']:
+            message_buffer.add(Message(**serializer.validated_data))
+            return Response(
+                {'success': True, 'queued': True, 'data': serializer.data},
+                status=status.HTTP_202_ACCEPTED
+            )
+        try:
+            serializer.save()
+        except Exception:
+            # Not written: let the sender retry instead of being told it's a duplicate.
+            release_message(serializer.validated_data)
+            raise
         return Response(
             {'success': True, 'data': serializer.data},
             status=status.HTTP_201_CREATED
@@ -151,11 +363,222 @@ class MessageViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         message = self.get_object()
+        before = audit.snapshot(message)
         message.lu = True
         message.save()
+        audit.record(request.user, audit.UPDATE, message, before, audit.snapshot(message))
         return Response({'success': True, 'data': MessageSerializer(message).data})
 
 
+class SavedSearchViewSet(viewsets.ModelViewSet):
+    """
+    ViewSet for the current user's saved searches and their alerts.
+    """
+    serializer_class = SavedSearchSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return SavedSearch.objects.filter(user=self.request.user)
+    
+    def create(self, request, *args, **kwargs):
+        from .searches import saved_search_settings
+        
+        limit = saved_search_settings()['MAX_PER_USER']
+        if self.get_queryset().count() >= limit:
+            return Response(
+                {'success': False, 'message': f'Vous ne pouvez pas enregistrer plus de {limit} recherches.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return super().create(request, *args, **kwargs)
+    
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+    
+    @action(detail=False, methods=['get'])
+    def alerts(self, request):
+        """Get cars matching the user's saved searches, newest first."""
+        alerts = SearchAlert.objects.filter(user=request.user).select_related('car')
+        if request.query_params.get('unread') in ('1', 'true'):
+            alerts = alerts.filter(lu=False)
+        page = self.paginate_queryset(alerts)
+        serializer = SearchAlertSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+    
+    @action(detail=False, methods=['put'], url_path='alerts/read')
+    def read_alerts(self, request):
+        """Mark the given alerts (all of them by default) as read."""
+        alerts = SearchAlert.objects.filter(user=request.user, lu=False)
+        ids = request.data.get('ids') if hasattr(request.data, 'get') else None
+        if ids is not None:
+            if not isinstance(ids, list) or not all(type(alert_id) is int for alert_id in ids):
+                return Response(
+                    {'success': False, 'message': '"ids" doit être une liste d\'identifiants.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            alerts = alerts.filter(id__in=ids)
+        updated = alerts.update(lu=True)
+        return Response({'success': True, 'updated': updated})
+
+
+class ArchivedCarViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only access to archived cars (admin only).
+    """
+    serializer_class = ArchivedCarSerializer
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    
+    def get_queryset(self):
+        queryset = ArchivedCar.objects.all()
+        marque = self.request.query_params.get('marque')
+        if marque:
+            queryset = queryset.filter(marque__icontains=marque)
+        modele = self.request.query_params.get('modele')
+        if modele:
+            queryset = queryset.filter(modele__icontains=modele)
+        return queryset
+
+
+class ArchivedMessageViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only access to archived messages (admin only).
+    """
+    serializer_class = ArchivedMessageSerializer
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    
+    def get_queryset(self):
+        queryset = ArchivedMessage.objects.all()
+        email = self.request.query_params.get('email')
+        if email:
+            queryset = queryset.filter(email__iexact=email)
+        voiture = self.request.query_params.get('voiture')
+        if voiture:
+            queryset = queryset.filter(voiture_id=voiture)
+        return queryset
+
+
+class AuditEntryPagination(CursorPagination):
+    """Cursor pages: no COUNT(*) over a table that only grows."""
+    ordering = '-created_at'
+    page_size = 50
+
+
+class AuditEntryViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only access to the audit log (admin only), newest first.
+    """
+    serializer_class = AuditEntrySerializer
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    pagination_class = AuditEntryPagination
+    
+    def list(self, request, *args, **kwargs):
+        for name in ('actor', 'object_id'):
+            try:
+                int(request.query_params.get(name) or 0)
+            except ValueError:
+                return Response(
+                    {'success': False, 'message': f'"{name}" doit être un identifiant numérique.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        return super().list(request, *args, **kwargs)
+    
+    def get_queryset(self):
+        queryset = AuditEntry.objects.select_related('actor')
+        if self.action != 'list':
+            return queryset
+        actor = self.request.query_params.get('actor')
+        if actor:
+            queryset = queryset.filter(actor_id=actor)
+        model = self.request.query_params.get('model')
+        if model:
+            queryset = queryset.filter(model=model)
+        object_id = self.request.query_params.get('object_id')
+        if object_id:
+            queryset = queryset.filter(object_id=object_id)
+        action = self.request.query_params.get('action')
+        if action:
+            queryset = queryset.filter(action=action)
+        return queryset
+
+
+class UploadViewSet(viewsets.GenericViewSet):
+    """
+    Resumable image uploads (admin only). POST opens an upload for a file
+    of ``size`` bytes, optionally for a ``car``; each PATCH streams the raw
+    chunk body at the ``Upload-Offset`` header; GET returns the offset to
+    resume from and DELETE abandons the upload. The completed image URL is
+    appended to the car's images.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user).select_related('image')
+    
+    def create(self, request):
+        from .uploads import UploadError, start_upload, upload_settings
+        
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'errors': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        try:
+            session = start_upload(request.user, data['size'], data.get('filename', ''), data.get('car'))
+        except UploadError as exc:
+            return Response({'success': False, 'message': str(exc)}, status=exc.status)
+        return Response({
+            'success': True,
+            'upload': self.get_serializer(session).data,
+            'chunkSize': upload_settings()['MAX_CHUNK_SIZE']
+        }, status=status.HTTP_201_CREATED)
+    
+    def retrieve(self, request, pk=None):
+        return Response({
+            'success': True,
+            'upload': self.get_serializer(self.get_object()).data
+        })
+    
+    def partial_update(self, request, pk=None):
+        """Append the request body, read in small buffers, at the Upload-Offset header."""
+        from .uploads import UploadError, attach_to_car, image_url, write_chunk
+        
+        session = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return Response({
+                'success': False,
+                'message': 'Les en-têtes Upload-Offset et Content-Length sont requis.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            session = write_chunk(session, request.stream, offset, length)
+        except UploadError as exc:
+            return Response({
+                'success': False,
+                'message': str(exc),
+                'offset': session.offset
+            }, status=exc.status)
+        if session.complete and session.car_id is not None:
+            car, previous = attach_to_car(session, image_url(request, session.image))
+            audit.record(request.user, audit.UPDATE, car, {'images': previous}, {'images': car.images})
+        return Response({
+            'success': True,
+            'upload': self.get_serializer(session).data
+        })
+    
+    def destroy(self, request, pk=None):
+        from .uploads import abort_upload
+        
+        abort_upload(self.get_object())
+        return Response({
+            'success': True,
+            'message': 'Envoi annulé.'
+        })
+
+
 # Authentication Views
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -215,9 +638,10 @@ def login(request):
 @permission_classes([IsAuthenticated])
 def me(request):
     """Get current user profile."""
+    fields, expand = sparse_params(request)
     return Response({
         'success': True,
-        'user': UserSerializer(request.user).data
+        'user': UserSerializer(request.user, fields=fields, expand=expand).data
     })
 
 
@@ -265,11 +689,12 @@ def favorites(request, car_id=None):
     user = request.user
     
     if request.method == 'GET':
-        favorites = user.favorites.all()
-        serializer = CarListSerializer(favorites, many=True)
+        fields, expand = sparse_params(request)
+        favorites = sparse_queryset(user.favorites.all(), CarListSerializer, fields, expand)
+        serializer = CarListSerializer(favorites, many=True, fields=fields, expand=expand)
         return Response({
             'success': True,
-            'count': favorites.count(),
+            'count': len(serializer.data),
             'favorites': serializer.data
         })
     
@@ -322,6 +747,25 @@ def check_favorite(request, car_id):
     })
 
 
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def batch(request):
+    """Run several API calls in one round-trip, authenticating once."""
+    from .batch import InvalidBatch, parse_batch, run_batch
+    
+    try:
+        items = parse_batch(request.data)
+    except InvalidBatch as exc:
+        return Response(
+            {'success': False, 'message': str(exc)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return Response({
+        'success': True,
+        'responses': run_batch(request, items, parallel=bool(request.data.get('parallel')))
+    })
+
+
 # Admin Views
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -362,7 +806,8 @@ def admin_user(request, user_id):
     user = get_object_or_404(User, id=user_id)
     
     if request.method == 'GET':
-        serializer = UserSerializer(user)
+        fields, expand = sparse_params(request)
+        serializer = UserSerializer(user, fields=fields, expand=expand)
         return Response({
             'success': True,
             'user': serializer.data
@@ -371,7 +816,9 @@ def admin_user(request, user_id):
     elif request.method == 'PUT':
         serializer = UserSerializer(user, data=request.data, partial=True)
         if serializer.is_valid():
+            before = audit.snapshot(user)
             serializer.save()
+            audit.record(request.user, audit.UPDATE, user, before, audit.snapshot(user))
             return Response({
                 'success': True,
                 'user': serializer.data
@@ -387,7 +834,9 @@ def admin_user(request, user_id):
                 {'success': False, 'message': 'Impossible de supprimer un administrateur.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        before = audit.snapshot(user)
         user.delete()
+        audit.record(request.user, audit.DELETE, user, before, object_id=user_id)
         return Response({
             'success': True,
             'message': 'Utilisateur supprimé avec succès.'
@@ -404,10 +853,254 @@ def admin_users(request):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    users = User.objects.all().order_by('-date_joined')
-    serializer = UserSerializer(users, many=True)
+    fields, expand = sparse_params(request)
+    users = sparse_queryset(User.objects.order_by('-date_joined'), UserSerializer, fields, expand)
+    serializer = UserSerializer(users, many=True, fields=fields, expand=expand)
     return Response({
         'success': True,
-        'count': users.count(),
+        'count': len(serializer.data),
         'users': serializer.data
     })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def admin_price_stats(request):
+    """Get materialized price statistics (admin only)."""
+    if request.user.role != 'ADMIN':
+        return Response(
+            {'message': 'Vous n\'êtes pas autorisé à effectuer cette action.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    statistics = PriceStatistic.objects.filter(level=request.query_params.get('level', 'marque'))
+    marque = request.query_params.get('marque')
+    if marque:
+        statistics = statistics.filter(marque__iexact=marque)
+    modele = request.query_params.get('modele')
+    if modele:
+        statistics = statistics.filter(modele__iexact=modele)
+    annee = request.query_params.get('annee')
+    if annee:
+        statistics = statistics.filter(annee=annee)
+    
+    serializer = PriceStatisticSerializer(statistics, many=True)
+    return Response({
+        'success': True,
+        'count': len(serializer.data),
+        'statistics': serializer.data
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def admin_price_outliers(request):
+    """Get cars priced far from their model's median (admin only)."""
+    if request.user.role != 'ADMIN':
+        return Response(
+            {'message': 'Vous n\'êtes pas autorisé à effectuer cette action.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    statistics = PriceStatistic.objects.filter(level='modele').exclude(outliers=[])
+    marque = request.query_params.get('marque')
+    if marque:
+        statistics = statistics.filter(marque__iexact=marque)
+    
+    outliers = [
+        {**outlier, 'marque': stat.marque, 'modele': stat.modele, 'median': stat.median}
+        for stat in statistics.only('marque', 'modele', 'median', 'outliers')
+        for outlier in stat.outliers
+    ]
+    outliers.sort(key=lambda outlier: outlier['score'], reverse=True)
+    return Response({
+        'success': True,
+        'count': len(outliers),
+        'outliers': outliers
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def admin_price_refresh(request):
+    """Refresh stale price statistics, or all of them with full=true (admin only)."""
+    if request.user.role != 'ADMIN':
+        return Response(
+            {'message': 'Vous n\'êtes pas autorisé à effectuer cette action.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    from .analytics import refresh_price_statistics  # NumPy: keep it off cold starts
+    
+    full = str(request.data.get('full', '')).lower() in ('true', '1', 'yes')
+    refreshed = refresh_price_statistics(full=full)
+    return Response({
+        'success': True,
+        'refreshedMarques': refreshed
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def admin_profiles(request):
+    """List the most recent request profiles (admin only)."""
+    if request.user.role != 'ADMIN':
+        return Response(
+            {'message': 'Vous n\'êtes pas autorisé à effectuer cette action.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    try:
+        limit = int(request.query_params.get('limit', 20))
+    except ValueError:
+        limit = 20
+    profiles = [
+        {key: value for key, value in summary.items() if key != 'queries'}
+        for summary in get_store().recent(max(limit, 1))
+    ]
+    return Response({
+        'success': True,
+        'count': len(profiles),
+        'profiles': profiles
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def admin_profile(request, profile_id):
+    """Get a request profile with its SQL queries, or ?download=speedscope for the speedscope file (admin only)."""
+    if request.user.role != 'ADMIN':
+        return Response(
+            {'message': 'Vous n\'êtes pas autorisé à effectuer cette action.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    speedscope = request.query_params.get('download') == 'speedscope'
+    content = get_store().load(profile_id, 'speedscope' if speedscope else 'json')
+    if content is None:
+        return Response(
+            {'message': 'Profil introuvable.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    if speedscope:
+        response = JsonResponse(content)
+        response['Content-Disposition'] = f'attachment; filename="{profile_id}.speedscope.json"'
+        return response
+    return Response({
+        'success': True,
+        'profile': content
+    })
+
+
+# Live Events
+def _event_channels(params, user):
+    """Resolve requested channels; None if the user may not read one of them."""
+    from . import events
+    
+    channels = set(filter(None, params.get('channels', events.INVENTORY).split(',')))
+    if not channels or not channels <= set(events.CHANNELS):
+        return None
+    if events.INBOX in channels and not (user and user.is_authenticated and user.role == 'ADMIN'):
+        return None
+    return channels
+
+
+def _last_event_id(request, params):
+    try:
+        return int(request.headers.get('Last-Event-ID') or params.get('after') or 0)
+    except ValueError:
+        return 0
+
+
+def _sse_format(event_list):
+    return ''.join(
+        f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+        for event in event_list
+    )
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def events_poll(request):
+    """Long-poll for inventory and inbox events."""
+    from . import events
+    
+    channels = _event_channels(request.query_params, request.user)
+    if channels is None:
+        return Response(
+            {'message': 'Vous n\'êtes pas autorisé à effectuer cette action.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    after = _last_event_id(request, request.query_params)
+    event_list = events.get_broker().wait(after, channels, events.events_settings()['POLL_TIMEOUT'])
+    return Response({
+        'success': True,
+        'events': event_list,
+        'lastEventId': event_list[-1]['id'] if event_list else after
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def events_ticket(request):
+    """Issue a short-lived ticket for opening the event stream (EventSource sends no headers)."""
+    from . import events
+    
+    return Response({
+        'success': True,
+        'ticket': events.stream_ticket(request.user),
+        'expiresIn': events.events_settings()['TICKET_TTL']
+    })
+
+
+def events_stream(request):
+    """
+    Server-sent events stream, authenticated by a ?ticket= from
+    events/ticket/ or an Authorization header. Under ASGI the stream ends
+    after MAX_STREAM_DURATION seconds; under WSGI the response is a single
+    long-poll batch. Either way the browser reconnects with Last-Event-ID.
+    """
+    from . import events
+    
+    user = None
+    if request.GET.get('ticket'):
+        user = events.ticket_user(request.GET['ticket'])
+        if user is None:
+            return JsonResponse({'message': 'Ticket invalide ou expiré.'}, status=status.HTTP_401_UNAUTHORIZED)
+    else:
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except (InvalidToken, TokenError, AuthenticationFailed):
+            return JsonResponse({'message': 'Jeton invalide.'}, status=status.HTTP_401_UNAUTHORIZED)
+        user = result[0] if result else None
+    
+    channels = _event_channels(request.GET, user)
+    if channels is None:
+        return JsonResponse(
+            {'message': 'Vous n\'êtes pas autorisé à effectuer cette action.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    after = _last_event_id(request, request.GET)
+    config = events.events_settings()
+    broker = events.get_broker()
+    
+    if isinstance(request, ASGIRequest):
+        async def stream():
+            yield 'retry: 3000\n\n'
+            # Heartbeats wake the loop at least every HEARTBEAT seconds to check the deadline.
+            deadline = time.monotonic() + config['MAX_STREAM_DURATION']
+            listener = broker.listen(after, channels, config['HEARTBEAT'])
+            try:
+                async for event_list in listener:
+                    yield _sse_format(event_list) if event_list else ': keep-alive\n\n'
+                    if time.monotonic() >= deadline:
+                        break
+            finally:
+                await listener.aclose()
+        response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    else:
+        event_list = broker.wait(after, channels, config['POLL_TIMEOUT'])
+        response = HttpResponse('retry: 0\n\n' + _sse_format(event_list), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
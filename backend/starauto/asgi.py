@@ -0,0 +1,16 @@
+"""
+ASGI config for Star Auto backend project.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'starauto.settings')
+
+application = get_asgi_application()
+
+if os.environ.get('DJANGO_WARMUP', 'False').lower() in ('true', '1', 'yes'):
+    from api.warmup import warmup
+
+    warmup()
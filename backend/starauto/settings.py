@@ -45,6 +45,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'starauto.urls'
@@ -66,6 +67,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'starauto.wsgi.application'
+ASGI_APPLICATION = 'starauto.asgi.application'
 
 
 # Database
@@ -78,6 +80,15 @@ DATABASES = {
     }
 }
 
+# Archived cars and messages can be kept in a separate SQLite file (see api/archive.py)
+if os.environ.get('ARCHIVE_DATABASE'):
+    DATABASES['archive'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['ARCHIVE_DATABASE'],
+    }
+
+DATABASE_ROUTERS = ['api.archive.ArchiveRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -138,9 +149,149 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
+    # Reverse proxies in front of the app whose X-Forwarded-For entries are trusted
+    # for the client IP (per-IP throttles). 0 ignores the client-supplied header.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+}
+
+
+# Contact message ingestion (see api/ingestion.py)
+# THROTTLE_BACKEND: 'local' (per process) or 'cache' (shared through CACHE_ALIAS)
+MESSAGE_INGESTION = {
+    'THROTTLE_BACKEND': os.environ.get('MESSAGE_THROTTLE_BACKEND', 'local'),
+    'CACHE_ALIAS': 'default',
+    'IP_RATE': '10/hour',
+    'IP_BURST': 5,
+    'EMAIL_RATE': '5/hour',
+    'EMAIL_BURST': 3,
+    'DEDUP_WINDOW': 600,  # seconds
+    'BATCH_WRITES': os.environ.get('MESSAGE_BATCH_WRITES', 'False').lower() in ('true', '1', 'yes'),
+    'BATCH_SIZE': 50,
+    'BATCH_INTERVAL': 2.0,  # seconds
+}
+
+
+# Similar car recommendations (see api/recommendations.py)
+SIMILAR_CARS = {
+    'TOP_K': 8,
+    'COFAVORITE_WEIGHT': 0.5,
+    'SYNC_INTERVAL': 5.0,  # seconds between reads of other processes' changes
+    'SETTLE_SECONDS': 2,
+    'REBUILD_INTERVAL': 3600.0,  # seconds between full background rebuilds
 }
 
 
+# Catalogue change feed (see api/changefeed.py)
+CHANGE_FEED = {
+    'PAGE_SIZE': 100,
+    'MAX_PAGE_SIZE': 1000,
+    'TOMBSTONE_RETENTION_DAYS': 30,
+    'SETTLE_SECONDS': 2,
+}
+
+
+# Live events (see api/events.py)
+# BACKEND: 'api.events.LocalBroker' (per process) or 'api.events.CacheBroker' (shared)
+EVENTS = {
+    'BACKEND': os.environ.get('EVENTS_BACKEND', 'api.events.LocalBroker'),
+    'BUFFER_SIZE': 1000,
+    'POLL_TIMEOUT': 25,  # seconds
+    'HEARTBEAT': 15,  # seconds
+    'CACHE_ALIAS': 'default',
+    'CACHE_POLL_INTERVAL': 1.0,  # seconds
+    'MAX_STREAM_DURATION': 300,  # seconds, then the client reconnects
+    'TICKET_TTL': 60,  # seconds a stream ticket can be used
+}
+
+
+# Static catalogue snapshots (see api/snapshots.py), written under STATIC_ROOT
+CATALOGUE_SNAPSHOTS = {
+    'DIRECTORY': 'catalogue',
+    'AUTO_REBUILD': os.environ.get('CATALOGUE_AUTO_REBUILD', 'False').lower() in ('true', '1', 'yes'),
+    'REBUILD_DELAY': 5.0,  # seconds, coalesces bursts of writes
+}
+
+
+# Batch requests (see api/batch.py)
+BATCH_REQUESTS = {
+    'MAX_REQUESTS': 20,
+    'MAX_WORKERS': 4,  # threads for parallel read-only sub-requests; 0 disables
+}
+
+
+# Saved search alerts (see api/searches.py)
+SAVED_SEARCHES = {
+    'MAX_PER_USER': 20,
+    'PRICE_BUCKET_RATIO': 1.25,  # width of the price buckets of the search index
+    'MAX_PRICE_BUCKETS': 8,  # wider price ranges are not indexed by price
+    'MATCH_INTERVAL': 2.0,  # seconds saved cars wait to be matched in one batch
+}
+
+
+# Popularity counters (see api/popularity.py), flushed in batches
+POPULARITY = {
+    'FLUSH_INTERVAL': 10.0,  # seconds
+    'FLUSH_SIZE': 1000,  # cars with pending counts
+    'FAVORITE_WEIGHT': 10,  # a favorite counts as this many views
+}
+
+
+# Hot/cold archival (see api/archive.py), run with `manage.py archivedata`
+ARCHIVE = {
+    'DATABASE': 'archive' if os.environ.get('ARCHIVE_DATABASE') else 'default',
+    'CAR_RETENTION_DAYS': 90,  # sold cars untouched for this long
+    'MESSAGE_RETENTION_DAYS': 180,  # read messages older than this
+    'BATCH_SIZE': 500,
+}
+
+
+# Columnar catalogue index (see api/catalogue_index.py, needs NumPy): answers
+# car list filters and sorts from memory instead of SQL
+CATALOGUE_INDEX = {
+    'ENABLED': os.environ.get('CATALOGUE_INDEX_ENABLED', 'False').lower() in ('true', '1', 'yes'),
+    'SYNC_INTERVAL': 5.0,  # seconds between reads of other processes' changes
+    'SETTLE_SECONDS': 2,
+}
+
+
+# Brand and model autocomplete (see api/autocomplete.py)
+AUTOCOMPLETE = {
+    'LIMIT': 8,
+    'MAX_LIMIT': 20,
+    'MAX_AGE': 300.0,  # seconds between background rebuilds
+}
+
+
+# Audit log of admin mutations (see api/audit.py), written in batches
+AUDIT_LOG = {
+    'ENABLED': True,
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 2.0,  # seconds
+}
+
+
+# On-demand request profiling (see api/profiling.py), triggered by admins
+# with the X-Profile: 1 header or the ?_profile=1 query flag
+PROFILING = {
+    'ENABLED': os.environ.get('PROFILING_ENABLED', 'False').lower() in ('true', '1', 'yes'),
+    'DIRECTORY': os.environ.get('PROFILING_DIRECTORY', 'profiles'),  # relative to BASE_DIR
+    'INTERVAL': 0.001,  # seconds between stack samples
+    'MAX_PROFILES': 50,  # older profiles are deleted
+    'MAX_DURATION': 60.0,  # seconds, sampling stops after this
+}
+
+
+# Resumable image uploads (see api/uploads.py): chunks are streamed to disk
+# and files stored once under MEDIA_ROOT by content hash
+IMAGE_UPLOADS = {
+    'MAX_SIZE': 25 * 1024 * 1024,  # bytes per image
+    'MAX_CHUNK_SIZE': 8 * 1024 * 1024,  # bytes per PATCH
+    'BUFFER_SIZE': 64 * 1024,  # bytes read from the request at a time
+    'WRITE_LEASE_SECONDS': 600,  # a chunk interrupted by a crash blocks its upload this long
+    'SESSION_TTL_HOURS': 24,  # abandoned uploads are deleted after this
+    'ORPHAN_GRACE_DAYS': 7,  # unreferenced images are deleted after this
+}
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
@@ -167,5 +318,6 @@ CORS_ALLOW_CREDENTIALS = True
 
 
 # File Upload Settings
-FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
+# Larger multipart files, and ASGI request bodies, are spooled to disk
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(2.5 * 1024 * 1024)  # 2.5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
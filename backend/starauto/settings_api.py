@@ -0,0 +1,44 @@
+"""
+Lean settings for serverless deployments.
+
+Select with DJANGO_SETTINGS_MODULE=starauto.settings_api. Renders JSON
+only and keeps the database connection opened by the warmup hook. The
+Django admin (with sessions, messages, static files and templates) stays
+available; set DJANGO_API_ONLY=True to drop it as well, which shortens
+cold starts further on deployments that manage data elsewhere.
+"""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+
+
+API_ONLY = os.environ.get('DJANGO_API_ONLY', 'False').lower() in ('true', '1', 'yes')
+
+LEAN_EXCLUDED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+]
+
+LEAN_EXCLUDED_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+if API_ONLY:
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in LEAN_EXCLUDED_APPS]
+    MIDDLEWARE = [middleware for middleware in MIDDLEWARE if middleware not in LEAN_EXCLUDED_MIDDLEWARE]
+    TEMPLATES = []
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': ('rest_framework.renderers.JSONRenderer',),
+}
+
+# Keep the connection opened by the warmup hook for the instance's lifetime.
+DATABASES['default']['CONN_MAX_AGE'] = None
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
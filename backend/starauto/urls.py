@@ -2,15 +2,20 @@
 URL configuration for Star Auto backend project.
 """
 
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
 ]
 
+# The lean API-only settings (starauto.settings_api) leave the admin out.
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+    
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
+
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
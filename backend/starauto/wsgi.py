@@ -9,3 +9,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'starauto.settings')
 
 application = get_wsgi_application()
+
+if os.environ.get('DJANGO_WARMUP', 'False').lower() in ('true', '1', 'yes'):
+    from api.warmup import warmup
+
+    warmup()
@@ -109,4 +109,41 @@ export const messageAPI = {
   },
 };
 
+// Batch API: several calls in one round-trip
+export const batchAPI = {
+  run: async (requests, { parallel = true } = {}) => {
+    const res = await api.post('/batch', { requests, parallel });
+    return res.data.responses;
+  },
+};
+
+// Image uploads: sent in chunks, resumed after a failed chunk
+export const uploadAPI = {
+  upload: async (file, { car, onProgress } = {}) => {
+    const start = await api.post('/uploads', { size: file.size, filename: file.name, car });
+    const { id } = start.data.upload;
+    const { chunkSize } = start.data;
+    let offset = 0;
+    let upload = start.data.upload;
+    let retries = 0;
+    while (!upload.complete) {
+      try {
+        const res = await api.patch(`/uploads/${id}`, file.slice(offset, offset + chunkSize), {
+          headers: { 'Content-Type': 'application/octet-stream', 'Upload-Offset': offset },
+        });
+        upload = res.data.upload;
+        retries = 0;
+      } catch (error) {
+        if (retries++ >= 3 || (error.response && error.response.status !== 409)) throw error;
+        // Resume from the bytes the server actually stored.
+        const res = await api.get(`/uploads/${id}`);
+        upload = res.data.upload;
+      }
+      offset = upload.offset;
+      onProgress?.(offset / file.size);
+    }
+    return upload.url;
+  },
+};
+
 export default api;